@@ -0,0 +1,339 @@
+"""Versioned JSON API, mounted by ``main.py`` under ``/api/v1``.
+
+Every request runs in one transaction, so a bulk call either applies all of
+its items or, on the first bad one, none. Lists are answered with compact
+rows; an issue's description is only sent by ``GET /issues/{id}``.
+"""
+
+from typing import Annotated, Literal
+
+import sqlmodel
+from fastapi import APIRouter, HTTPException, Query
+
+from core import columns, comments, events, issues, projects, tags
+from core.issues import Status
+from db import SessionDep
+
+# Items accepted by one bulk call.
+MAX_BATCH = 1000
+
+router = APIRouter(prefix="/api/v1")
+
+
+class ProjectIn(sqlmodel.SQLModel):
+    name: str
+
+
+class ColumnIn(sqlmodel.SQLModel):
+    name: str
+    position: int = 0
+
+
+class IssueIn(sqlmodel.SQLModel):
+    title: str
+    column_id: int
+    description: str = ""
+    priority: int | None = None
+    type: str | None = None
+    color: str | None = None
+
+
+class IssueUpdate(sqlmodel.SQLModel):
+    id: int
+    title: str | None = None
+    description: str | None = None
+    priority: int | None = None
+    type: str | None = None
+    color: str | None = None
+
+
+class IssueMove(sqlmodel.SQLModel):
+    id: int
+    column_id: int
+    position: int | None = None
+    after_id: int | None = None
+    before_id: int | None = None
+
+
+class CommentIn(sqlmodel.SQLModel):
+    issue_id: int
+    text: str
+
+
+class TagsIn(sqlmodel.SQLModel):
+    issue_ids: list[int]
+    add: list[str] = []
+    remove: list[str] = []
+
+
+class LogIn(sqlmodel.SQLModel):
+    minutes: int
+
+
+def _batch(items: list) -> list:
+    if not items:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(items) > MAX_BATCH:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_BATCH} items per call"
+        )
+    return items
+
+
+def _project(project) -> dict:
+    return {
+        "id": project.id,
+        "name": project.name,
+        "ctime": project.ctime,
+        "mtime": project.mtime,
+    }
+
+
+def _column(column) -> dict:
+    return {
+        "id": column.id,
+        "project_id": column.project_id,
+        "name": column.name,
+        "position": column.position,
+    }
+
+
+def _issue(issue, description: bool = False) -> dict:
+    row = {
+        "id": issue.id,
+        "project_id": issue.project_id,
+        "column_id": issue.column_id,
+        "position": issue.position,
+        "title": issue.title,
+        "status": issue.status,
+        "priority": issue.priority,
+        "type": issue.type,
+        "color": issue.color,
+        "ctime": issue.ctime,
+        "mtime": issue.mtime,
+        "stime": issue.stime,
+        "etime": issue.etime,
+        "time_spent": issue.time_spent,
+    }
+    if description:
+        row["description"] = issue.description
+    return row
+
+
+def _get_issue(session: sqlmodel.Session, issue_id: int):
+    issue = issues.Issue(session).get_issue(issue_id)
+    if issue is None:
+        raise HTTPException(status_code=404, detail=f"Issue {issue_id} not found")
+    return issue
+
+
+def _column_ids(session: sqlmodel.Session, project_id: int) -> set[int]:
+    if projects.Project(session).get_mtime(project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return {
+        column.id
+        for column in columns.Column(session).get_columns_by_project(project_id)
+    }
+
+
+@router.get("/projects")
+def list_projects(session: SessionDep, limit: int = 50, offset: int = 0):
+    limit = max(1, min(limit, issues.MAX_PAGE_SIZE))
+    return [
+        _project(project)
+        for project in projects.Project(session).get_projects(limit, offset)
+    ]
+
+
+@router.post("/projects", status_code=201)
+def create_project(session: SessionDep, body: ProjectIn):
+    return _project(projects.Project(session).create(body.name))
+
+
+@router.get("/projects/{project_id}")
+def get_project(session: SessionDep, project_id: int):
+    project = projects.Project(session).get_project(project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return {
+        **_project(project),
+        "columns": [
+            _column(column)
+            for column in columns.Column(session).get_columns_by_project(project_id)
+        ],
+    }
+
+
+@router.post("/projects/{project_id}/columns", status_code=201)
+def create_columns(session: SessionDep, project_id: int, body: list[ColumnIn]):
+    _column_ids(session, project_id)
+    created = columns.Column(session).create_many(
+        project_id, [item.model_dump() for item in _batch(body)]
+    )
+    return [_column(column) for column in created]
+
+
+@router.get("/projects/{project_id}/issues")
+def list_issues(
+    session: SessionDep,
+    project_id: int,
+    before: str | None = None,
+    after: str | None = None,
+    limit: int = issues.PAGE_SIZE,
+    tag: Annotated[list[str] | None, Query()] = None,
+    match: Literal["all", "any"] = "all",
+):
+    try:
+        before_key = issues.decode_cursor(before) if before else None
+        after_key = issues.decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    tag = tags.normalize(tag or [])
+    page = issues.Issue(session).get_issues_page(
+        project_id, limit, before=before_key, after=after_key, tags=tag, match=match
+    )
+    page["issues"] = [_issue(issue) for issue, _ in page["issues"]]
+    return page
+
+
+@router.post("/projects/{project_id}/issues", status_code=201)
+def create_issues(session: SessionDep, project_id: int, body: list[IssueIn]):
+    known = _column_ids(session, project_id)
+    for item in _batch(body):
+        if item.column_id not in known:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Column {item.column_id} is not in project {project_id}",
+            )
+    created = issues.Issue(session).create_many(
+        project_id, [item.model_dump() for item in body]
+    )
+    return [_issue(issue) for issue in created]
+
+
+@router.get("/projects/{project_id}/events")
+def list_events(
+    session: SessionDep,
+    project_id: int,
+    since: int | None = None,
+    until: int | None = None,
+):
+    # Rows as arrays; the field names are sent once.
+    fields = ("id", "ctime", "issue_id", "event_name", "action_name")
+    return {
+        "fields": [*fields, "log"],
+        "events": [
+            [getattr(event, name) for name in fields]
+            + [event.log.decode("utf-8", "replace") if event.log else None]
+            for event in events.Event(session).get_by_project(project_id, since, until)
+            # Leave out the neighbours the gantt replay reads around a window.
+            if (since is None or event.ctime >= since)
+            and (until is None or event.ctime <= until)
+        ],
+    }
+
+
+@router.get("/projects/{project_id}/tags")
+def project_tags(session: SessionDep, project_id: int):
+    return [
+        {"value": tag.value, "issues": count}
+        for tag, count in tags.Tag(session).get_counts(project_id)
+    ]
+
+
+@router.get("/issues/{issue_id}")
+def get_issue(session: SessionDep, issue_id: int):
+    issue = _get_issue(session, issue_id)
+    return {
+        **_issue(issue, description=True),
+        "tags": [
+            tag.value for tag, _ in tags.Tag(session).get_tags_by_issue_id(issue_id)
+        ],
+    }
+
+
+@router.patch("/issues")
+def update_issues(session: SessionDep, body: list[IssueUpdate]):
+    items = [item.model_dump(exclude_none=True) for item in _batch(body)]
+    updated = issues.Issue(session).update_many(items)
+    for item, issue in zip(body, updated):
+        if issue is None:
+            raise HTTPException(status_code=404, detail=f"Issue {item.id} not found")
+    return [_issue(issue) for issue in updated]
+
+
+@router.post("/issues/move")
+def move_issues(session: SessionDep, body: list[IssueMove]):
+    issue_service = issues.Issue(session)
+    found = issue_service.get_many([item.id for item in _batch(body)])
+    known = {}
+    for item in body:
+        if item.id not in found:
+            raise HTTPException(status_code=404, detail=f"Issue {item.id} not found")
+        project_id = found[item.id].project_id
+        if project_id not in known:
+            known[project_id] = _column_ids(session, project_id)
+        if item.column_id not in known[project_id]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Column {item.column_id} is not in project {project_id}",
+            )
+    moved = issue_service.move_many([item.model_dump() for item in body])
+    return [
+        {"id": issue.id, "column_id": issue.column_id, "position": issue.position}
+        for issue in moved
+    ]
+
+
+@router.post("/issues/{issue_id}/start")
+def start_issue(session: SessionDep, issue_id: int):
+    if _get_issue(session, issue_id).status == int(Status.ACTIVE):
+        raise HTTPException(status_code=400, detail="Issue already active")
+    return _issue(issues.Issue(session).start(issue_id))
+
+
+@router.post("/issues/{issue_id}/stop")
+def stop_issue(session: SessionDep, issue_id: int):
+    if _get_issue(session, issue_id).status != int(Status.ACTIVE):
+        raise HTTPException(status_code=400, detail="Issue is not active")
+    return _issue(issues.Issue(session).stop(issue_id))
+
+
+@router.post("/issues/{issue_id}/log")
+def log_issue_time(session: SessionDep, issue_id: int, body: LogIn):
+    if _get_issue(session, issue_id).status != int(Status.ACTIVE):
+        raise HTTPException(status_code=400, detail="Issue is not active")
+    return _issue(issues.Issue(session).log(issue_id, max(0, body.minutes) * 60))
+
+
+@router.get("/issues/{issue_id}/comments")
+def list_comments(session: SessionDep, issue_id: int):
+    _get_issue(session, issue_id)
+    return comments.Comment(session).get_by_issue(issue_id)
+
+
+@router.post("/comments", status_code=201)
+def create_comments(session: SessionDep, body: list[CommentIn]):
+    comment_service = comments.Comment(session)
+    created = []
+    for item in _batch(body):
+        _get_issue(session, item.issue_id)
+        text = item.text.strip()
+        if not text:
+            raise HTTPException(status_code=400, detail="Empty comment")
+        comment = comment_service.create(item.issue_id, text)
+        created.append(
+            {"id": comment.id, "issue_id": comment.issue_id, "ctime": comment.ctime}
+        )
+    return created
+
+
+@router.post("/issues/tags")
+def tag_issues(session: SessionDep, body: TagsIn):
+    _batch(body.issue_ids)
+    tag_service = tags.Tag(session)
+    added = tag_service.tag_issues(body.issue_ids, body.add) if body.add else []
+    removed = (
+        tag_service.untag_issues(body.issue_ids, body.remove) if body.remove else 0
+    )
+    return {"added": [tag.value for tag in added], "removed": removed}
@@ -0,0 +1,116 @@
+"""Time rendering the board page of a large project.
+
+    python bench.py [ISSUES] [RENDERS]
+
+Seeds a throwaway SQLite database with one project of ISSUES issues (500 by
+default), a fifth of them started and stopped so the gantt has bars, then
+renders board.html with the development and the production template setup.
+For each it reports building the environment, the first render, which
+compiles whatever was not precompiled, and the median of RENDERS more.
+"""
+
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+WORKDIR = tempfile.mkdtemp(prefix="cado-bench-")
+# Never touch a real database; set before db creates its engine.
+os.environ["DATABASE_URL"] = f"sqlite:///{WORKDIR}/bench.db"
+os.environ["EVENT_SINK"] = "sync"
+
+import db
+import migrations
+from core import boards, columns, issues, projects, templating, timeline
+
+
+def seed(issue_count: int) -> int:
+    project = projects.Project().create("bench")
+    column_ids = [
+        columns.Column().create(name, project.id, position).id
+        for position, name in enumerate(("Backlog", "Todo", "Doing", "Review", "Done"))
+    ]
+    created = issues.Issue().create_many(
+        project.id,
+        [
+            {
+                "title": f"Issue {n}",
+                "column_id": column_ids[n % len(column_ids)],
+                "description": f"Description of issue {n}, long enough to excerpt.",
+            }
+            for n in range(issue_count)
+        ],
+    )
+    issue_service = issues.Issue()
+    for issue in created[::5]:
+        issue_service.start(issue.id)
+        issue_service.stop(issue.id)
+    return project.id
+
+
+def board_context(project_id: int) -> dict:
+    loaded = boards.Board().get_board(project_id)
+    return {
+        "project": loaded["project"],
+        "board_data": loaded["board_data"],
+        "load_gantt": lambda: timeline.build(
+            loaded["board_data"], loaded["events"], history=loaded["history"]
+        ),
+        "active_page": "projects",
+        "active_subpage": "board",
+    }
+
+
+def clear_filter_caches():
+    for memoized in (
+        templating.format_timestamp_utc,
+        templating.format_status,
+        templating.format_duration,
+    ):
+        memoized.cache_clear()
+
+
+def measure(label: str, context: dict, renders: int, **options):
+    clear_filter_caches()
+    started = time.perf_counter()
+    env = templating.create_environment("templates", **options)
+    setup = time.perf_counter() - started
+
+    started = time.perf_counter()
+    env.get_template("board.html").render(context)
+    first = time.perf_counter() - started
+
+    timings = []
+    for _ in range(renders):
+        started = time.perf_counter()
+        env.get_template("board.html").render(context)
+        timings.append(time.perf_counter() - started)
+    print(
+        f"{label:<20}{setup * 1000:>10.1f}{first * 1000:>10.1f}"
+        f"{statistics.median(timings) * 1000:>10.2f}"
+    )
+
+
+def main(issue_count: int, renders: int):
+    migrations.run(db.engine)
+    context = board_context(seed(issue_count))
+    cache_dir = os.path.join(WORKDIR, "jinja")
+
+    print(f"board.html, {issue_count} issues, times in ms")
+    print(f"{'':<20}{'setup':>10}{'first':>10}{'median':>10}")
+    measure("development", context, renders, production=False)
+    measure("production, cold", context, renders, production=True, cache_dir=cache_dir)
+    measure("production, warm", context, renders, production=True, cache_dir=cache_dir)
+
+
+if __name__ == "__main__":
+    try:
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+        )
+    finally:
+        db.engine.dispose()
+        shutil.rmtree(WORKDIR, ignore_errors=True)
@@ -0,0 +1,168 @@
+"""Fingerprinted, pre-compressed static files.
+
+    python -m core.assets
+
+copies every file under static/ into static/build/ with the start of its
+content hash in the name, next to a .gz copy and, when the brotli package is
+installed, a .br copy of each text file that compression makes smaller, and
+writes the original-to-built name map to static/build/manifest.json.
+
+``static_url`` turns a path under static/ into the URL of its built copy;
+``AssetFiles`` serves those with a year-long immutable Cache-Control and the
+smallest encoding the client accepts. Without a build, ``static_url`` falls
+back to the plain files, which browsers revalidate on every use.
+"""
+
+import functools
+import gzip
+import json
+import mimetypes
+import os
+import pathlib
+import shutil
+import sys
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from core import utils
+
+try:
+    import brotli
+except ImportError:  # optional, gzip alone without it
+    brotli = None
+
+STATIC_DIR = "static"
+STATIC_URL = "/static"
+BUILD_DIR = "build"
+MANIFEST = "manifest.json"
+HASH_LENGTH = 12
+COMPRESSIBLE = {".css", ".js", ".svg", ".ico", ".json", ".txt"}
+# Preferred first.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _fingerprinted(name: str, body: bytes) -> str:
+    path = pathlib.PurePosixPath(name)
+    digest = utils.hash(body)[:HASH_LENGTH]
+    return path.with_name(f"{path.stem}.{digest}{path.suffix}").as_posix()
+
+
+def _compress(path: pathlib.Path, body: bytes):
+    variants = {".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(body, quality=11)
+    for suffix, data in variants.items():
+        if len(data) < len(body):
+            path.with_name(path.name + suffix).write_bytes(data)
+
+
+def build(directory: str = STATIC_DIR) -> dict:
+    """Rebuild ``directory``/build from the files around it; return the manifest."""
+    root = pathlib.Path(directory)
+    target = root / BUILD_DIR
+    shutil.rmtree(target, ignore_errors=True)
+    manifest = {}
+    for source in sorted(root.rglob("*")):
+        if not source.is_file():
+            continue
+        name = source.relative_to(root).as_posix()
+        body = source.read_bytes()
+        built = _fingerprinted(name, body)
+        output = target / built
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_bytes(body)
+        if source.suffix in COMPRESSIBLE:
+            _compress(output, body)
+        manifest[name] = built
+    (target / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+@functools.cache
+def manifest(directory: str = STATIC_DIR) -> dict:
+    try:
+        return json.loads((pathlib.Path(directory) / BUILD_DIR / MANIFEST).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def static_url(path: str) -> str:
+    """The URL of ``path`` under static/, fingerprinted once built."""
+    built = manifest().get(path)
+    if built is None:
+        return f"{STATIC_URL}/{path}"
+    return f"{STATIC_URL}/{BUILD_DIR}/{built}"
+
+
+def _accepts(accept_encoding: str, encoding: str) -> bool:
+    for item in accept_encoding.lower().split(","):
+        token, _, params = item.partition(";")
+        if token.strip() not in (encoding, "*"):
+            continue
+        try:
+            return float(params.strip().removeprefix("q=") or 1) > 0
+        except ValueError:
+            return True
+    return False
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles serving the build with long-lived caching and compression."""
+
+    def __init__(self, *, directory: str = STATIC_DIR, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.build_dir = os.path.realpath(os.path.join(directory, BUILD_DIR))
+        # Compressed copies only change with a rebuild, which means a restart.
+        self.encoded = set()
+        for folder, _, files in os.walk(self.build_dir):
+            for name in files:
+                self.encoded.add(os.path.join(folder, name))
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        # Already resolved by lookup_path.
+        full_path = str(full_path)
+        request_headers = Headers(scope=scope)
+        if full_path.startswith(self.build_dir + os.sep):
+            headers = {"Cache-Control": IMMUTABLE}
+        else:
+            headers = {"Cache-Control": "no-cache"}
+
+        media_type = None
+        variants = [
+            (encoding, full_path + suffix)
+            for encoding, suffix in ENCODINGS
+            if full_path + suffix in self.encoded
+        ]
+        if variants:
+            headers["Vary"] = "Accept-Encoding"
+            accept_encoding = request_headers.get("accept-encoding", "")
+            for encoding, variant in variants:
+                if _accepts(accept_encoding, encoding):
+                    media_type = mimetypes.guess_type(full_path)[0]
+                    headers["Content-Encoding"] = encoding
+                    full_path = variant
+                    stat_result = os.stat(variant)
+                    break
+
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type,
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else STATIC_DIR
+    built = build(directory)
+    print(
+        f"built {len(built)} files into {directory}/{BUILD_DIR}"
+        + ("" if brotli else " (gzip only, brotli is not installed)")
+    )
@@ -0,0 +1,133 @@
+import sqlmodel
+
+import db
+from core import cache
+from core.events import Event, sink
+from core.issues import STREAM_BATCH_SIZE, Status
+from core.projects import Project
+from core.session import Service
+
+
+class Board(Service):
+    def _load(
+        self,
+        session: sqlmodel.Session,
+        project_id: int,
+        since: int | None,
+        until: int | None,
+    ):
+        project = session.get(db.projects, project_id)
+        if project is None:
+            return None
+
+        cols = list(
+            session.exec(
+                sqlmodel.select(db.columns)
+                .where(db.columns.project_id == project_id)
+                .where(db.columns.active)
+                .order_by(db.columns.position, db.columns.id)
+            ).all()
+        )
+
+        issues_by_column = {col.id: [] for col in cols}
+        if issues_by_column:
+            statement = (
+                sqlmodel.select(db.issues)
+                .where(db.issues.column_id.in_(list(issues_by_column)))
+                .where(db.issues.active)
+            )
+            if since is not None:
+                statement = statement.where(
+                    sqlmodel.or_(
+                        db.issues.mtime >= since,
+                        db.issues.etime >= since,
+                        db.issues.status == int(Status.ACTIVE),
+                    )
+                )
+            if until is not None:
+                statement = statement.where(db.issues.ctime <= until)
+            result = session.exec(
+                statement.order_by(db.issues.column_id, db.issues.position)
+            )
+            for issue in result.all():
+                issues_by_column[issue.column_id].append(issue)
+
+        return {
+            "project": project,
+            "board_data": [
+                {"column": col, "issues": issues_by_column[col.id]} for col in cols
+            ],
+        }
+
+    def get_board(
+        self,
+        project_id: int,
+        with_events: bool = True,
+        since: int | None = None,
+        until: int | None = None,
+    ):
+        """Load a project with its columns, their issues and its events.
+
+        ``since``/``until`` narrow the load to a gantt window: issues created
+        after it or last touched before it are skipped, and only the events
+        needed to draw the window are read. The unwindowed project, columns
+        and issues are served from the cache while the project's version holds.
+        """
+        if with_events:
+            # Before the first read, so the snapshot includes the flushed rows.
+            sink.flush()
+        with self._session() as session:
+            version = Project(session).get_version(project_id)
+            if version is None:
+                return None
+            if since is None and until is None:
+                loaded = cache.get_or_load(
+                    cache.project_key(project_id, version, "board"),
+                    lambda: self._load(session, project_id, None, None),
+                )
+            else:
+                loaded = self._load(session, project_id, since, until)
+            if loaded is None:
+                return None
+
+            events_list = []
+            history = {}
+            if with_events:
+                events_list = Event(session).get_by_project(project_id, since, until)
+                history = Event(session).get_history(project_id, since, until)
+            return {**loaded, "events": events_list, "history": history}
+
+    def iter_board(self, project_id: int):
+        """Yield ``{"column", "issues"}`` for each active column, in order.
+
+        All issues come from one query read STREAM_BATCH_SIZE rows at a time,
+        so each column's ``issues`` is an iterator that must be used up
+        before the next column is taken.
+        """
+        with self._session() as session:
+            cols = session.exec(
+                sqlmodel.select(db.columns)
+                .where(db.columns.project_id == project_id)
+                .where(db.columns.active)
+                .order_by(db.columns.position, db.columns.id)
+            ).all()
+            rows = iter(
+                session.exec(
+                    sqlmodel.select(db.issues)
+                    .join(db.columns, db.issues.column_id == db.columns.id)
+                    .where(db.columns.project_id == project_id)
+                    .where(db.columns.active)
+                    .where(db.issues.active)
+                    .order_by(db.columns.position, db.columns.id, db.issues.position)
+                    .execution_options(yield_per=STREAM_BATCH_SIZE)
+                )
+            )
+            head = [next(rows, None)]
+
+            def column_issues(column_id: int):
+                while head[0] is not None and head[0].column_id == column_id:
+                    yield head[0]
+                    head[0] = next(rows, None)
+
+            for col in cols:
+                yield {"column": col, "issues": column_issues(col.id)}
@@ -0,0 +1,183 @@
+"""Read-through cache for project-scoped reads.
+
+Entries whose content changes with the project are keyed on its ``version``,
+which every mutation increments, so a stale entry is never read again
+even from another process. ``invalidate_project`` additionally drops what
+this process (or a shared Redis) holds for the project right away.
+
+CACHE_URL selects the backend: empty for an in-process LRU, ``redis://...``
+for Redis or anything speaking its protocol, ``none`` to disable caching.
+Values are pickled in both, so callers never share mutable objects.
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import sqlalchemy
+import sqlmodel
+
+try:
+    import redis
+except ImportError:  # optional, only needed for CACHE_URL=redis://...
+    redis = None
+
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "1024"))
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+
+_MISSING = object()
+_STALE = "stale_projects"
+
+
+class LocalCache:
+    """Thread-safe LRU with a per-entry time to live."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: int = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key: str, data: bytes):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    def __init__(self, url: str, ttl: int = CACHE_TTL):
+        if redis is None:
+            raise RuntimeError("CACHE_URL needs the redis package installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str):
+        return self.client.get(key)
+
+    def set(self, key: str, data: bytes):
+        self.client.set(key, data, ex=self.ttl)
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def delete_prefix(self, prefix: str):
+        # Entries keyed on an older version are unreachable and expire on their
+        # own; scanning the keyspace for them is not worth it.
+        pass
+
+    def clear(self):
+        self.client.flushdb()
+
+
+class NullCache:
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, data: bytes):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+    def delete_prefix(self, prefix: str):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _create_backend(url: str):
+    if url == "none":
+        return NullCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url)
+    return LocalCache()
+
+
+backend = _create_backend(CACHE_URL)
+
+
+def project_key(project_id: int, *parts) -> str:
+    return ":".join(["project", str(project_id), *map(str, parts)])
+
+
+def get(key: str, default=None):
+    data = backend.get(key)
+    if data is None:
+        return default
+    return pickle.loads(data)
+
+
+def put(key: str, value):
+    backend.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def get_or_load(key: str, load):
+    """Return the cached value for ``key``, calling ``load()`` on a miss.
+
+    ``None`` results are not cached.
+    """
+    value = get(key, _MISSING)
+    if value is _MISSING:
+        value = load()
+        if value is not None:
+            put(key, value)
+    return value
+
+
+def invalidate_project(project_id: int):
+    """Drop every entry cached for ``project_id``."""
+    key = project_key(project_id)
+    backend.delete(key)
+    backend.delete_prefix(key + ":")
+
+
+def invalidate_on_commit(session: sqlmodel.Session, project_id: int):
+    """Invalidate ``project_id`` now and again once ``session`` commits.
+
+    The second pass drops anything another request cached from the rows
+    this transaction was still replacing.
+    """
+    invalidate_project(project_id)
+    session.info.setdefault(_STALE, set()).add(project_id)
+
+
+@sqlalchemy.event.listens_for(sqlmodel.Session, "after_commit")
+def _invalidate_committed(session):
+    for project_id in session.info.pop(_STALE, ()):
+        invalidate_project(project_id)
+
+
+@sqlalchemy.event.listens_for(sqlmodel.Session, "after_rollback")
+def _forget_stale(session):
+    session.info.pop(_STALE, None)
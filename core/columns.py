@@ -3,12 +3,14 @@ import time
 import sqlmodel
 
 import db
+from core import cache
 from core.projects import Project
+from core.session import Service
 
 
-class Column:
+class Column(Service):
     def create(self, name: str, project_id: int, position: int = 0):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             now = int(time.time())
             column = db.columns(
                 name=name,
@@ -19,23 +21,62 @@ class Column:
                 active=True,
             )
             session.add(column)
-            session.commit()
+            Project(session).update_mtime(project_id)
+            self._commit(session)
             session.refresh(column)
-            project = Project()
-            project.update_mtime(project_id)
 
             return column
 
+    def create_many(self, project_id: int, items: list[dict]):
+        """Create a column per item of ``items``, each a ``name`` and ``position``.
+
+        The project's mtime moves once for the whole batch.
+        """
+        with self._session() as session:
+            now = int(time.time())
+            created = [
+                db.columns(
+                    name=item["name"],
+                    project_id=project_id,
+                    position=item.get("position") or 0,
+                    ctime=now,
+                    mtime=now,
+                    active=True,
+                )
+                for item in items
+            ]
+            if not created:
+                return []
+            session.add_all(created)
+            Project(session).update_mtime(project_id)
+            session.flush()
+            ids = [column.id for column in created]
+            self._commit(session)
+            return list(
+                session.exec(
+                    sqlmodel.select(db.columns)
+                    .where(db.columns.id.in_(ids))
+                    .order_by(db.columns.id)
+                ).all()
+            )
+
     def get_columns_by_project(self, project_id: int):
-        with sqlmodel.Session(db.engine) as session:
-            result = session.exec(
-                sqlmodel.select(db.columns)
-                .where(db.columns.project_id == project_id)
-                .where(db.columns.active)
-                .order_by(db.columns.position)
+        with self._session() as session:
+            version = Project(session).get_version(project_id)
+            if version is None:
+                return []
+            return cache.get_or_load(
+                cache.project_key(project_id, version, "columns"),
+                lambda: list(
+                    session.exec(
+                        sqlmodel.select(db.columns)
+                        .where(db.columns.project_id == project_id)
+                        .where(db.columns.active)
+                        .order_by(db.columns.position)
+                    ).all()
+                ),
             )
-            return list(result.all())
 
     def get_column(self, column_id: int):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             return session.get(db.columns, column_id)
@@ -4,9 +4,13 @@ from typing import List
 import sqlmodel
 
 import db
+from core import hub
+from core.projects import Project
+from core.search import Search
+from core.session import Service
 
 
-class Comment:
+class Comment(Service):
     def _get_default_user_id(self, session: sqlmodel.Session) -> int:
         """Return a usable user id, creating a default user if none exist."""
         existing = session.exec(
@@ -17,12 +21,11 @@ class Comment:
 
         user = db.users(username="anonymous", token="")
         session.add(user)
-        session.commit()
-        session.refresh(user)
+        session.flush()
         return user.id
 
     def create(self, issue_id: int, text: str, user_id: int | None = None):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             now = int(time.time())
             resolved_user_id = (
                 user_id if user_id is not None else self._get_default_user_id(session)
@@ -35,12 +38,27 @@ class Comment:
                 comment=text.encode("utf-8"),
             )
             session.add(comment)
-            session.commit()
+            session.flush()
+            Search(session).index_comment(comment)
+            issue = session.get(db.issues, issue_id)
+            if issue is not None and issue.project_id:
+                Project(session).update_mtime(issue.project_id)
+                hub.publish(
+                    session,
+                    issue.project_id,
+                    {
+                        "kind": "comment",
+                        "action": "create",
+                        "id": comment.id,
+                        "issue_id": issue_id,
+                    },
+                )
+            self._commit(session)
             session.refresh(comment)
             return comment
 
     def get_by_issue(self, issue_id: int) -> List[dict]:
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             results = session.exec(
                 sqlmodel.select(db.comments, db.users.username)
                 .join(db.users, db.comments.user_id == db.users.id, isouter=True)
@@ -0,0 +1,106 @@
+"""Validators for conditional GETs of project and issue pages.
+
+Every change to a project bumps ``projects.version`` (comments and tags
+included), so a page's ETag only needs that, the issue's own ``mtime`` on
+issue pages and the newest event on pages that draw the gantt. Last-Modified
+comes from the matching timestamps. Pages that
+depend on the clock, because an issue is running or the URL asks for the
+last N days, also carry the current ETAG_TIME_BUCKET.
+"""
+
+import json
+import os
+import pathlib
+import time
+
+import sqlmodel
+
+import db
+from core import assets, utils
+from core.events import sink
+from core.issues import Status
+from core.session import Service
+
+TIME_BUCKET = int(os.getenv("ETAG_TIME_BUCKET", "60"))
+
+
+def _template_version(directory: str = "templates") -> str:
+    # Part of every ETag, so a deploy that changes the markup, or the asset
+    # URLs in it, never answers 304 for a page rendered by the previous one.
+    parts = []
+    for path in sorted(pathlib.Path(directory).rglob("*.html")):
+        parts.append(f"{path}:{utils.hash(path.read_text())}")
+    parts.append(json.dumps(assets.manifest(), sort_keys=True))
+    return utils.hash("\n".join(parts))[:16]
+
+
+TEMPLATE_VERSION = _template_version()
+
+
+def make(*parts) -> str:
+    return '"' + utils.hash(":".join(map(str, (TEMPLATE_VERSION, *parts))))[:32] + '"'
+
+
+class ETag(Service):
+    def for_project(
+        self,
+        project_id: int,
+        page: str,
+        query: str = "",
+        with_events: bool = False,
+        clock: bool = False,
+    ) -> tuple[str, int] | None:
+        """Return ``(etag, last_modified)`` for a project page, or None."""
+        if with_events:
+            # Before the first read, like Board.get_board, so buffered events
+            # are part of both the validator and the page it stands for.
+            sink.flush()
+        with self._session() as session:
+            last_event = sqlmodel.literal(0)
+            if with_events:
+                last_event = (
+                    sqlmodel.select(sqlmodel.func.max(db.events.ctime))
+                    .where(db.events.project_id == project_id)
+                    .scalar_subquery()
+                )
+            running = (
+                sqlmodel.select(db.issues.id)
+                .where(db.issues.project_id == project_id)
+                .where(db.issues.status == int(Status.ACTIVE))
+                .where(db.issues.active == sqlmodel.true())
+                .exists()
+            )
+            row = session.exec(
+                sqlmodel.select(
+                    db.projects.version, db.projects.mtime, last_event, running
+                ).where(db.projects.id == project_id)
+            ).first()
+            if row is None:
+                return None
+            version, mtime, last_event, running = row
+            modified = max(mtime or 0, last_event or 0)
+            parts = [page, project_id, version, last_event or 0, query]
+            if running or clock:
+                now = int(time.time())
+                bucket = now - now % TIME_BUCKET
+                parts.append(bucket)
+                modified = max(modified, bucket)
+            return make(*parts), modified
+
+    def for_issue(
+        self, issue_id: int, page: str, query: str = ""
+    ) -> tuple[str, int] | None:
+        """Return ``(etag, last_modified)`` for an issue page, or None."""
+        with self._session() as session:
+            row = session.exec(
+                sqlmodel.select(db.issues.mtime, db.projects.version, db.projects.mtime)
+                .join(db.projects, db.issues.project_id == db.projects.id, isouter=True)
+                .where(db.issues.id == issue_id)
+            ).first()
+            if row is None:
+                return None
+            issue_mtime, project_version, project_mtime = row
+            return (
+                make(page, issue_id, issue_mtime, project_version or 0, query),
+                max(issue_mtime or 0, project_mtime or 0),
+            )
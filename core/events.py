@@ -1,11 +1,148 @@
+import atexit
+import json
+import logging
+import os
+import threading
 import time
+import zlib
 
+import sqlalchemy
 import sqlmodel
 
 import db
+from core.session import Service
 
+logger = logging.getLogger(__name__)
 
-class Event:
+# EVENT_SINK=sync writes each event in the transaction that produced it;
+# the default buffers them and writes batches after commit.
+SYNC = os.getenv("EVENT_SINK", "buffered") == "sync"
+BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "100"))
+FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "1.0"))
+# Rows kept for a retry when a batch fails to write.
+MAX_BUFFERED = 10000
+
+_PENDING = "pending_events"
+
+
+class EventSink:
+    """Collect ``events`` rows in memory and write them in bulk INSERTs.
+
+    Rows emitted on a session are held in its ``info`` until it commits, so
+    a rolled back request logs nothing. Committed rows are written once
+    ``batch_size`` of them are waiting or ``flush_interval`` seconds after
+    the first one arrived, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        sync: bool = SYNC,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sync = sync
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+
+    def emit(
+        self,
+        session: sqlmodel.Session,
+        project_id: int | None,
+        issue_id: int | None,
+        event_name: str,
+        action_name: str,
+        log: bytes | None = None,
+        ctime: int | None = None,
+    ):
+        row = {
+            "ctime": int(time.time()) if ctime is None else ctime,
+            "project_id": project_id,
+            "issue_id": issue_id,
+            "event_name": event_name,
+            "action_name": action_name,
+            "log": log,
+        }
+        if self.sync:
+            session.add(db.events(**row))
+        else:
+            session.info.setdefault(_PENDING, []).append(row)
+
+    def add(self, rows: list[dict]):
+        with self._lock:
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every committed row still buffered."""
+        with self._write_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not rows:
+                return
+            try:
+                with sqlmodel.Session(db.engine) as session:
+                    session.exec(sqlmodel.insert(db.events), params=rows)
+                    session.commit()
+            except sqlalchemy.exc.SQLAlchemyError:
+                logger.exception("failed to write %d events", len(rows))
+                with self._lock:
+                    self._buffer[:0] = rows[-MAX_BUFFERED:]
+
+
+sink = EventSink()
+# Scripts exit without a lifespan; the app flushes on shutdown too.
+atexit.register(sink.flush)
+
+
+@sqlalchemy.event.listens_for(sqlmodel.Session, "after_commit")
+def _hand_over_events(session):
+    rows = session.info.pop(_PENDING, None)
+    if rows:
+        sink.add(rows)
+
+
+@sqlalchemy.event.listens_for(sqlmodel.Session, "after_rollback")
+def _drop_events(session):
+    session.info.pop(_PENDING, None)
+
+
+_FIELDS = ("id", "ctime", "project_id", "issue_id", "event_name", "action_name")
+
+
+def pack(events_list) -> bytes:
+    """Serialize events for ``events_archive``: zlib-compressed JSON rows."""
+    rows = [
+        [getattr(event, name) for name in _FIELDS]
+        + [event.log.decode("latin-1") if event.log is not None else None]
+        for event in events_list
+    ]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode(), 9)
+
+
+def unpack(data: bytes) -> list:
+    """Rebuild the (detached) events stored by ``pack``."""
+    events_list = []
+    for row in json.loads(zlib.decompress(data)):
+        event = db.events(**dict(zip(_FIELDS, row)))
+        event.log = row[-1].encode("latin-1") if row[-1] is not None else None
+        events_list.append(event)
+    return events_list
+
+
+class Event(Service):
     def create(
         self,
         project_id: int | None,
@@ -14,26 +151,127 @@ class Event:
         action_name: str,
         log: bytes | None = None,
     ):
-        with sqlmodel.Session(db.engine) as session:
-            now = int(time.time())
-            event = db.events(
-                ctime=now,
-                project_id=project_id,
-                issue_id=issue_id,
-                event_name=event_name,
-                action_name=action_name,
-                log=log,
+        """Queue an event; it is written through ``sink`` once committed."""
+        with self._session() as session:
+            sink.emit(session, project_id, issue_id, event_name, action_name, log)
+            self._commit(session)
+
+    def _timed_neighbours(
+        self, session: sqlmodel.Session, project_id: int, at: int, before: bool
+    ):
+        """Each issue's last start and stop events before ``at``, or first after."""
+        timed = db.events.action_name.in_(("start", "stop"))
+        if before:
+            edge = sqlmodel.func.max(db.events.ctime)
+            beyond = db.events.ctime < at
+        else:
+            edge = sqlmodel.func.min(db.events.ctime)
+            beyond = db.events.ctime > at
+        nearest = (
+            sqlmodel.select(
+                db.events.issue_id, db.events.action_name, edge.label("ctime")
+            )
+            .where(db.events.project_id == project_id)
+            .where(db.events.issue_id.is_not(None))
+            .where(beyond)
+            .where(timed)
+            .group_by(db.events.issue_id, db.events.action_name)
+            .subquery()
+        )
+        return session.exec(
+            sqlmodel.select(db.events)
+            .join(
+                nearest,
+                sqlmodel.and_(
+                    db.events.issue_id == nearest.c.issue_id,
+                    db.events.action_name == nearest.c.action_name,
+                    db.events.ctime == nearest.c.ctime,
+                ),
+            )
+            .where(db.events.project_id == project_id)
+            .order_by(db.events.ctime, db.events.id)
+        ).all()
+
+    def get_by_project(
+        self,
+        project_id: int,
+        since: int | None = None,
+        until: int | None = None,
+    ):
+        """Return a project's events oldest first, optionally within a window.
+
+        A windowed result also carries each issue's nearest start and stop
+        events on either side of the window, which is all the outside history
+        needed to replay what the issue was doing inside it.
+        """
+        sink.flush()
+        with self._session() as session:
+            statement = sqlmodel.select(db.events).where(
+                db.events.project_id == project_id
+            )
+            if since is not None:
+                statement = statement.where(db.events.ctime >= since)
+            if until is not None:
+                statement = statement.where(db.events.ctime <= until)
+            events_list = list(
+                session.exec(statement.order_by(db.events.ctime, db.events.id)).all()
             )
-            session.add(event)
-            session.commit()
-            session.refresh(event)
-            return event
-
-    def get_by_project(self, project_id: int):
-        with sqlmodel.Session(db.engine) as session:
-            result = session.exec(
-                sqlmodel.select(db.events)
-                .where(db.events.project_id == project_id)
-                .order_by(db.events.ctime)
+            if since is not None:
+                events_list[:0] = self._timed_neighbours(
+                    session, project_id, since, before=True
+                )
+            if until is not None:
+                events_list.extend(
+                    self._timed_neighbours(session, project_id, until, before=False)
+                )
+            return events_list
+
+    def get_archived(self, issue_ids: list[int]):
+        """Return the archived events of ``issue_ids``, oldest first."""
+        with self._session() as session:
+            events_list = []
+            for data in session.exec(
+                sqlmodel.select(db.events_archive.data).where(
+                    db.events_archive.issue_id.in_(issue_ids)
+                )
+            ):
+                events_list.extend(unpack(data))
+            events_list.sort(key=lambda event: (event.ctime, event.id))
+            return events_list
+
+    def get_history(
+        self,
+        project_id: int,
+        since: int | None = None,
+        until: int | None = None,
+    ):
+        """Return ``{issue_id: (checkpoint, segments)}`` of compacted issues.
+
+        Only the summarized segments overlapping ``[since, until]`` are read;
+        the checkpoints carry the rest of the state the gantt replay needs.
+        """
+        with self._session() as session:
+            history = {
+                checkpoint.issue_id: (checkpoint, [])
+                for checkpoint in session.exec(
+                    sqlmodel.select(db.event_checkpoints).where(
+                        db.event_checkpoints.project_id == project_id
+                    )
+                )
+            }
+            if not history:
+                return history
+            statement = sqlmodel.select(db.event_segments).where(
+                db.event_segments.project_id == project_id
             )
-            return list(result.all())
+            if since is not None:
+                statement = statement.where(db.event_segments.etime >= since)
+            if until is not None:
+                statement = statement.where(db.event_segments.stime <= until)
+            for segment in session.exec(
+                statement.order_by(db.event_segments.issue_id, db.event_segments.id)
+            ):
+                entry = history.get(segment.issue_id)
+                if entry is not None:
+                    entry[1].append((segment.stime, segment.etime, segment.status))
+            return history
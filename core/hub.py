@@ -0,0 +1,226 @@
+"""Per-project fan-out of board changes to server-sent event streams.
+
+Services queue a compact delta on their session with ``publish``; like
+events, it only leaves once the transaction commits. The broker hands every
+delta to each worker's ``Hub``, which pushes it to the streams subscribed to
+that project and keeps the last HUB_BACKLOG of them so a reconnecting client
+can catch up from its ``Last-Event-ID``.
+
+HUB_URL selects the broker: empty for in-process delivery, enough for a
+single worker, or ``redis://...`` to fan out across workers through Redis
+pub/sub.
+"""
+
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import os
+import threading
+import uuid
+
+import sqlalchemy
+import sqlmodel
+
+try:
+    import redis
+except ImportError:  # optional, only needed for HUB_URL=redis://...
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+HUB_URL = os.getenv("HUB_URL", "")
+HUB_BACKLOG = int(os.getenv("HUB_BACKLOG", "256"))
+# Deltas a slow stream may fall behind by before it is told to reload.
+HUB_QUEUE_SIZE = int(os.getenv("HUB_QUEUE_SIZE", "256"))
+HEARTBEAT = 15.0
+
+_PENDING = "hub_messages"
+
+
+class Subscription:
+    def __init__(self, project_id: int, loop: asyncio.AbstractEventLoop):
+        self.project_id = project_id
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.overflowed = False
+
+    def push(self, event):
+        # Runs on the subscriber's event loop.
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= HUB_QUEUE_SIZE:
+            self.overflowed = True
+            event = None
+        self.queue.put_nowait(event)
+
+
+class Hub:
+    def __init__(self, backlog: int = HUB_BACKLOG):
+        self.backlog = backlog
+        # Event ids are only meaningful to the process that issued them.
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._subscribers = collections.defaultdict(set)
+        self._recent = collections.defaultdict(collections.deque)
+        self._evicted = collections.defaultdict(int)
+
+    def deliver(self, project_id: int, message: dict):
+        """Push ``message`` to this process's subscribers of ``project_id``."""
+        with self._lock:
+            event = (f"{self.epoch}-{next(self._seq)}", message)
+            recent = self._recent[project_id]
+            recent.append(event)
+            while len(recent) > self.backlog:
+                self._evicted[project_id] = _seq_of(recent.popleft()[0])
+            subscribers = list(self._subscribers.get(project_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:  # the stream's loop is gone
+                self.unsubscribe(subscription)
+
+    def subscribe(self, project_id: int, last_event_id: str | None = None):
+        """Return ``(subscription, missed)`` for a stream on the running loop.
+
+        ``missed`` lists the events after ``last_event_id``, or is None when
+        they can no longer be replayed and the client has to reload.
+        """
+        subscription = Subscription(project_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[project_id].add(subscription)
+            if not last_event_id:
+                return subscription, []
+            epoch, _, seq = last_event_id.partition("-")
+            if epoch != self.epoch or not seq.isdigit():
+                return subscription, None
+            seq = int(seq)
+            if seq < self._evicted[project_id]:
+                return subscription, None
+            missed = [
+                event for event in self._recent[project_id] if _seq_of(event[0]) > seq
+            ]
+            return subscription, missed
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.project_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.project_id]
+
+    async def stream(self, subscription: Subscription, missed, is_disconnected):
+        """Yield the subscription as ``text/event-stream`` chunks."""
+        try:
+            # Reconnect quickly; Last-Event-ID picks up where this left off.
+            yield "retry: 2000\n\n"
+            if missed is None:
+                yield _format(None, {"action": "reset"}, "reset")
+                return
+            for event_id, message in missed:
+                yield _format(event_id, message)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT)
+                except TimeoutError:
+                    if await is_disconnected():
+                        return
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    yield _format(None, {"action": "reset"}, "reset")
+                    return
+                yield _format(*event)
+        finally:
+            self.unsubscribe(subscription)
+
+
+def _seq_of(event_id: str) -> int:
+    return int(event_id.rpartition("-")[2])
+
+
+def _format(event_id: str | None, message: dict, name: str | None = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if name is not None:
+        lines.append(f"event: {name}")
+    lines.append("data: " + json.dumps(message, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+class LocalBroker:
+    def __init__(self, hub: Hub):
+        self.hub = hub
+
+    def publish(self, project_id: int, message: dict):
+        self.hub.deliver(project_id, message)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class RedisBroker:
+    CHANNEL = "cado:hub"
+
+    def __init__(self, url: str, hub: Hub):
+        if redis is None:
+            raise RuntimeError("HUB_URL needs the redis package installed")
+        self.client = redis.Redis.from_url(url)
+        self.hub = hub
+        self._thread = None
+
+    def publish(self, project_id: int, message: dict):
+        self.client.publish(self.CHANNEL, json.dumps([project_id, message]))
+
+    def _receive(self, item):
+        project_id, message = json.loads(item["data"])
+        self.hub.deliver(project_id, message)
+
+    def start(self):
+        if self._thread is None:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.CHANNEL: self._receive})
+            self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+
+def _create_broker(url: str, hub: Hub):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url, hub)
+    return LocalBroker(hub)
+
+
+hub = Hub()
+broker = _create_broker(HUB_URL, hub)
+
+
+def publish(session: sqlmodel.Session, project_id: int | None, message: dict):
+    """Queue ``message`` for ``project_id``'s streams once ``session`` commits."""
+    if project_id:
+        session.info.setdefault(_PENDING, []).append((project_id, message))
+
+
+@sqlalchemy.event.listens_for(sqlmodel.Session, "after_commit")
+def _publish_committed(session):
+    for project_id, message in session.info.pop(_PENDING, ()):
+        try:
+            broker.publish(project_id, message)
+        except Exception:
+            # Streams are best effort; the change itself is committed.
+            logger.exception("failed to publish to project %s", project_id)
+
+
+@sqlalchemy.event.listens_for(sqlmodel.Session, "after_rollback")
+def _drop_uncommitted(session):
+    session.info.pop(_PENDING, None)
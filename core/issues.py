@@ -1,13 +1,194 @@
 import time
+from enum import IntEnum
 
 import sqlmodel
 
 import db
-from core import utils
+from core import hub, utils
+from core.events import sink
 from core.projects import Project
+from core.rollups import Rollup
+from core.search import Search
+from core.session import Service
+from core.tags import normalize
 
 
-class Issue:
+class Status(IntEnum):
+    PENDING = 0
+    ACTIVE = 1
+    REVIEWING = 2
+    CLOSED = 3
+
+
+# Issues are ordered by sparse integer ranks. Spacing them POSITION_GAP apart
+# lets a reorder take the midpoint of its neighbours and touch only one row;
+# a column is renumbered only once two neighbours end up adjacent.
+POSITION_GAP = 1024
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Rows fetched per round trip when a listing is streamed.
+STREAM_BATCH_SIZE = 100
+
+
+# What a board card shows, and what an update may change of it, as sent to
+# the project's streams.
+_CARD_FIELDS = ("column_id", "position", "title", "description", "status")
+_UPDATE_FIELDS = ("title", "description", "status", "priority", "type", "color")
+
+
+def _paginate(rows, limit, before, after, key):
+    """Trim the ``limit + 1`` rows of a keyset query to a page.
+
+    Returns the rows with the ``newer`` and ``older`` cursors, None where
+    there is nothing more that way.
+    """
+    has_more = len(rows) > limit
+    if after is not None:
+        rows = rows[-limit:]
+        has_newer, has_older = has_more, True
+    else:
+        rows = rows[:limit]
+        has_newer, has_older = before is not None, has_more
+
+    newer = older = None
+    if rows:
+        if has_newer:
+            newer = encode_cursor(*key(rows[0]))
+        if has_older:
+            older = encode_cursor(*key(rows[-1]))
+    return rows, newer, older
+
+
+def encode_cursor(ctime: int, issue_id: int) -> str:
+    return f"{ctime}-{issue_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """Parse a ``ctime-id`` cursor; raises ValueError when malformed."""
+    ctime, issue_id = cursor.split("-")
+    return int(ctime), int(issue_id)
+
+
+def tagged(values: list[str], match: str = "all"):
+    """Select the ids of issues carrying all (or ``match="any"``) of ``values``.
+
+    Resolves the values through ``uq_tags_value`` and walks
+    ``ix_issues_tags_tag_issue``; the links are unique per issue and tag, so
+    counting them per issue tells whether every tag matched.
+    """
+    statement = (
+        sqlmodel.select(db.issues_tags.issue_id)
+        .join(db.tags, db.tags.id == db.issues_tags.tag_id)
+        .where(db.tags.value.in_(values))
+    )
+    if match != "any" and len(values) > 1:
+        statement = statement.group_by(db.issues_tags.issue_id).having(
+            sqlmodel.func.count() == len(values)
+        )
+    return statement
+
+
+class Issue(Service):
+    def _lock_column(self, session: sqlmodel.Session, column_id: int):
+        # Locking the column row serialises concurrent creates and moves into
+        # the same column, so two writers cannot pick the same position.
+        session.exec(
+            sqlmodel.select(db.columns.id)
+            .where(db.columns.id == column_id)
+            .with_for_update()
+        ).first()
+
+    def _last_position(self, session: sqlmodel.Session, column_id: int) -> int:
+        return session.exec(
+            sqlmodel.select(
+                sqlmodel.func.coalesce(sqlmodel.func.max(db.issues.position), 0)
+            )
+            .where(db.issues.column_id == column_id)
+            .where(db.issues.active == sqlmodel.true())
+        ).one()
+
+    def _neighbour_position(
+        self, session: sqlmodel.Session, neighbour_id: int | None, issue
+    ) -> int | None:
+        if neighbour_id is None or neighbour_id == issue.id:
+            return None
+        neighbour = session.get(db.issues, neighbour_id)
+        if neighbour is None or not neighbour.active:
+            return None
+        if neighbour.column_id != issue.column_id:
+            return None
+        return neighbour.position
+
+    def _rebalance(self, session: sqlmodel.Session, column_id: int, skip_id: int):
+        result = session.exec(
+            sqlmodel.select(db.issues)
+            .where(db.issues.column_id == column_id)
+            .where(db.issues.active == sqlmodel.true())
+            .where(db.issues.id != skip_id)
+            .order_by(db.issues.position, db.issues.id)
+        )
+        positions = []
+        project_id = None
+        for rank, other in enumerate(result.all(), start=1):
+            other.position = rank * POSITION_GAP
+            session.add(other)
+            positions.append([other.id, other.position])
+            project_id = other.project_id
+        session.flush()
+        hub.publish(
+            session,
+            project_id,
+            {
+                "kind": "column",
+                "action": "reorder",
+                "id": column_id,
+                "positions": positions,
+            },
+        )
+
+    def _rank_between(
+        self,
+        session: sqlmodel.Session,
+        issue,
+        after_id: int | None,
+        before_id: int | None,
+    ) -> int:
+        for _ in range(2):
+            lower = self._neighbour_position(session, after_id, issue)
+            upper = self._neighbour_position(session, before_id, issue)
+            if lower is None and upper is None:
+                return self._last_position(session, issue.column_id) + POSITION_GAP
+            if upper is None:
+                return lower + POSITION_GAP
+            if lower is None:
+                return upper - POSITION_GAP
+            if upper - lower > 1:
+                return (lower + upper) // 2
+            self._rebalance(session, issue.column_id, issue.id)
+        # Neighbours given in the wrong order; keep the card next to after_id.
+        return lower + 1
+
+    def _new(self, title, column_id, project_id, description, position, now):
+        return db.issues(
+            title=title,
+            column_id=column_id,
+            project_id=project_id,
+            ctime=now,
+            etime=0,
+            stime=0,
+            mtime=now,
+            checksum=utils.hash(title),
+            position=position,
+            score=0,
+            priority=3,
+            description=description,
+            color="#7CA37C",
+            status=0,
+            active=True,
+            type="task",
+        )
+
     def create(
         self,
         title: str,
@@ -15,120 +196,322 @@ class Issue:
         project_id: int = None,
         description: str = "",
     ):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             now = int(time.time())
-            statement = sqlmodel.select(db.issues).where(
-                db.issues.column_id == column_id
-            )
-            existing = list(session.exec(statement).all())
-            max_pos = max([i.position for i in existing], default=0) if existing else 0
-
-            issue = db.issues(
-                title=title,
-                column_id=column_id,
-                project_id=project_id,
-                ctime=now,
-                etime=0,
-                stime=0,
-                mtime=now,
-                checksum=utils.hash(title),
-                position=max_pos + 1,
-                score=0,
-                priority=3,
-                description=description,
-                color="#7CA37C",
-                status=0,
-                active=True,
-                type="task",
+            self._lock_column(session, column_id)
+            max_pos = self._last_position(session, column_id)
+
+            issue = self._new(
+                title, column_id, project_id, description, max_pos + POSITION_GAP, now
             )
             session.add(issue)
-            session.commit()
-            session.refresh(issue)
             if project_id:
-                project = Project()
-                project.update_mtime(project_id)
+                Project(session).update_mtime(project_id)
+            session.flush()
+            Search(session).index_issue(issue)
+            self._publish(session, issue, "create", *_CARD_FIELDS)
+            self._commit(session)
+            session.refresh(issue)
             return issue
 
-    def move(self, issue_id: int, new_column_id: int, new_position: int = None):
-        with sqlmodel.Session(db.engine) as session:
+    def create_many(self, project_id: int, items: list[dict]):
+        """Create an issue per item of ``items``, appended to their columns.
+
+        Items hold ``title`` and ``column_id`` and may set ``description``,
+        ``priority``, ``type`` and ``color``; they start pending. Each
+        column is locked and scanned once, and the project's mtime moves once.
+        """
+        with self._session() as session:
+            now = int(time.time())
+            positions = {}
+            for column_id in sorted({item["column_id"] for item in items}):
+                self._lock_column(session, column_id)
+                positions[column_id] = self._last_position(session, column_id)
+
+            created = []
+            for item in items:
+                column_id = item["column_id"]
+                positions[column_id] += POSITION_GAP
+                issue = self._new(
+                    item["title"],
+                    column_id,
+                    project_id,
+                    item.get("description") or "",
+                    positions[column_id],
+                    now,
+                )
+                for key in ("priority", "type", "color"):
+                    if item.get(key) is not None:
+                        setattr(issue, key, item[key])
+                created.append(issue)
+            if not created:
+                return []
+            session.add_all(created)
+            Project(session).update_mtime(project_id)
+            session.flush()
+            Search(session).index_issues(created)
+            for issue in created:
+                self._publish(session, issue, "create", *_CARD_FIELDS)
+            ids = [issue.id for issue in created]
+            self._commit(session)
+            return list(
+                session.exec(
+                    sqlmodel.select(db.issues)
+                    .where(db.issues.id.in_(ids))
+                    .order_by(db.issues.id)
+                ).all()
+            )
+
+    def _by_id(self, session: sqlmodel.Session, issue_ids) -> dict:
+        return {
+            issue.id: issue
+            for issue in session.exec(
+                sqlmodel.select(db.issues).where(db.issues.id.in_(set(issue_ids)))
+            ).all()
+        }
+
+    def _touch_many(self, session: sqlmodel.Session, issues):
+        for project_id in sorted({issue.project_id for issue in issues}):
+            if project_id:
+                Project(session).update_mtime(project_id)
+
+    def _reload(self, session: sqlmodel.Session, issues) -> list:
+        # One query instead of a refresh per issue; keeps the given order.
+        loaded = self._by_id(session, [issue.id for issue in issues])
+        return [loaded[issue.id] for issue in issues]
+
+    def get_many(self, issue_ids: list[int]) -> dict:
+        """Return the issues of ``issue_ids`` that exist, by id."""
+        with self._session() as session:
+            return self._by_id(session, issue_ids)
+
+    def update_many(self, items: list[dict]) -> list:
+        """Apply each item's fields to the issue of its ``id``.
+
+        Returns the issues in the order of ``items``, with None for ids that
+        do not exist. The issues are loaded in one query and every project
+        involved has its mtime moved once.
+        """
+        with self._session() as session:
+            now = int(time.time())
+            found = self._by_id(session, [item["id"] for item in items])
+            updated = []
+            reindex = []
+            for item in items:
+                issue = found.get(item["id"])
+                if issue is None:
+                    updated.append(None)
+                    continue
+                fields = {key: value for key, value in item.items() if key != "id"}
+                for key, value in fields.items():
+                    if hasattr(issue, key):
+                        setattr(issue, key, value)
+                issue.mtime = now
+                if "title" in fields or "description" in fields:
+                    reindex.append(issue)
+                self._publish(
+                    session,
+                    issue,
+                    "update",
+                    *[name for name in _UPDATE_FIELDS if name in fields],
+                )
+                updated.append(issue)
+            changed = [issue for issue in updated if issue is not None]
+            if not changed:
+                return updated
+            session.add_all(changed)
+            Search(session).index_issues(reindex)
+            self._touch_many(session, changed)
+            self._commit(session)
+            reloaded = iter(self._reload(session, changed))
+            return [None if issue is None else next(reloaded) for issue in updated]
+
+    def move_many(self, items: list[dict]) -> list:
+        """Move each item's issue to its ``column_id``, like ``move``.
+
+        Items hold ``id`` and ``column_id`` and may set ``position``,
+        ``after_id`` and ``before_id``; without any, an issue changing column
+        is appended to it. Returns the issues in the order of
+        ``items``, with None for ids that do not exist. Each target column
+        is locked once and every project involved has its mtime moved once.
+        """
+        with self._session() as session:
+            now = int(time.time())
+            found = self._by_id(session, [item["id"] for item in items])
+            for column_id in sorted({item["column_id"] for item in items}):
+                self._lock_column(session, column_id)
+            moved = []
+            # Last position per column, for appends; dropped once a ranked or
+            # explicit move into the column may have changed it.
+            tails = {}
+            for item in items:
+                issue = found.get(item["id"])
+                if issue is None:
+                    moved.append(None)
+                    continue
+                column_id = item["column_id"]
+                after_id = item.get("after_id")
+                before_id = item.get("before_id")
+                if after_id is not None or before_id is not None:
+                    issue.column_id = column_id
+                    issue.position = self._rank_between(
+                        session, issue, after_id, before_id
+                    )
+                    tails.pop(column_id, None)
+                elif item.get("position") is not None:
+                    issue.column_id = column_id
+                    issue.position = item["position"]
+                    tails.pop(column_id, None)
+                elif issue.column_id != column_id:
+                    # Looked up before the issue joins the column, like move.
+                    if column_id not in tails:
+                        tails[column_id] = self._last_position(session, column_id)
+                    tails[column_id] += POSITION_GAP
+                    issue.column_id = column_id
+                    issue.position = tails[column_id]
+                issue.mtime = now
+                session.add(issue)
+                self._publish(session, issue, "move", "column_id", "position")
+                moved.append(issue)
+            changed = [issue for issue in moved if issue is not None]
+            if not changed:
+                return moved
+            self._touch_many(session, changed)
+            self._commit(session)
+            reloaded = iter(self._reload(session, changed))
+            return [None if issue is None else next(reloaded) for issue in moved]
+
+    def move(
+        self,
+        issue_id: int,
+        new_column_id: int,
+        new_position: int = None,
+        after_id: int | None = None,
+        before_id: int | None = None,
+    ):
+        """Move an issue to ``new_column_id``.
+
+        When ``after_id`` (the card above) or ``before_id`` (the card below)
+        is given, the issue is ranked between them and ``new_position`` is
+        ignored. With neither nor ``new_position``, an issue changing column
+        is appended to it.
+        """
+        with self._session() as session:
             issue = session.get(db.issues, issue_id)
             if issue:
+                ranked = after_id is not None or before_id is not None
+                if not ranked and new_position is None:
+                    if issue.column_id != new_column_id:
+                        # Before the issue joins the column, or its old
+                        # position would count as the column's last.
+                        self._lock_column(session, new_column_id)
+                        new_position = (
+                            self._last_position(session, new_column_id) + POSITION_GAP
+                        )
                 issue.column_id = new_column_id
-                if new_position is not None:
+                if ranked:
+                    self._lock_column(session, new_column_id)
+                    issue.position = self._rank_between(
+                        session, issue, after_id, before_id
+                    )
+                elif new_position is not None:
                     issue.position = new_position
                 issue.mtime = int(time.time())
                 session.add(issue)
-                session.commit()
+                self._touch(session, issue)
+                self._publish(session, issue, "move", "column_id", "position")
+                self._commit(session)
                 session.refresh(issue)
                 return issue
             return None
 
+    def _touch(self, session: sqlmodel.Session, issue):
+        if issue.project_id:
+            Project(session).update_mtime(issue.project_id)
+
+    def _publish(self, session: sqlmodel.Session, issue, action: str, *fields):
+        message = {"kind": "issue", "action": action, "id": issue.id}
+        for name in fields:
+            message[name] = getattr(issue, name)
+        if "description" in fields:
+            # Cards only show the start of it.
+            message["description"] = (issue.description or "")[:50]
+        hub.publish(session, issue.project_id, message)
+
+    def _close_run(self, session: sqlmodel.Session, issue, now: int):
+        # Credit the running interval before it is stopped or restarted.
+        if issue.status == Status.ACTIVE and issue.stime:
+            rollup = Rollup(session)
+            issue.time_spent += rollup.add_tracked(issue, issue.stime, now)
+
     def start(self, issue_id: int):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             issue = session.get(db.issues, issue_id)
             if issue:
                 now = int(time.time())
+                self._close_run(session, issue, now)
                 issue.stime = now
                 issue.etime = 0
                 issue.status = 1
                 issue.mtime = now
-                event = db.events(
-                    ctime=now,
-                    project_id=issue.project_id,
-                    issue_id=issue.id,
-                    event_name="issue",
-                    action_name="start",
-                    log=None,
+                sink.emit(
+                    session, issue.project_id, issue.id, "issue", "start", ctime=now
                 )
                 session.add(issue)
-                session.add(event)
-                session.commit()
+                self._touch(session, issue)
+                self._publish(session, issue, "start", "status", "stime", "etime")
+                self._commit(session)
                 session.refresh(issue)
                 return issue
             return None
 
     def stop(self, issue_id: int):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             issue = session.get(db.issues, issue_id)
             if issue:
                 now = int(time.time())
-                if issue.stime:
-                    elapsed = max(0, now - issue.stime)
-                    if issue.time_spent <= 0:
-                        issue.time_spent = elapsed
+                self._close_run(session, issue, now)
                 issue.etime = now
                 issue.status = 3
                 issue.mtime = now
-                event = db.events(
-                    ctime=now,
-                    project_id=issue.project_id,
-                    issue_id=issue.id,
-                    event_name="issue",
-                    action_name="stop",
-                    log=None,
+                sink.emit(
+                    session, issue.project_id, issue.id, "issue", "stop", ctime=now
                 )
                 session.add(issue)
-                session.add(event)
-                session.commit()
+                self._touch(session, issue)
+                self._publish(session, issue, "stop", "status", "stime", "etime")
+                self._commit(session)
                 session.refresh(issue)
                 return issue
             return None
 
     def log(self, issue_id: int, seconds: int):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             issue = session.get(db.issues, issue_id)
             if issue:
                 if seconds > 0:
+                    now = int(time.time())
                     issue.time_spent += seconds
-                    issue.mtime = int(time.time())
+                    issue.mtime = now
+                    Rollup(session).add_logged(issue, seconds, now)
+                    sink.emit(
+                        session,
+                        issue.project_id,
+                        issue.id,
+                        "issue",
+                        "log",
+                        str(seconds).encode(),
+                        ctime=now,
+                    )
                     session.add(issue)
-                    session.commit()
+                    self._touch(session, issue)
+                    self._commit(session)
                     session.refresh(issue)
                 return issue
             return None
 
     def get_issues_by_column(self, column_id: int):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             result = session.exec(
                 sqlmodel.select(db.issues)
                 .where(db.issues.column_id == column_id)
@@ -138,25 +521,150 @@ class Issue:
             return list(result.all())
 
     def get_issue(self, issue_id: int):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             return session.get(db.issues, issue_id)
 
-    def get_issues(self, project_id: int | None = None):
-        with sqlmodel.Session(db.engine) as session:
+    def _issues_statement(
+        self,
+        statement,
+        project_id: int | None,
+        before: tuple[int, int] | None,
+        after: tuple[int, int] | None,
+        tags: list[str] | None,
+        match: str,
+    ):
+        statement = statement.where(db.issues.active == sqlmodel.true())
+        if project_id is not None:
+            statement = statement.where(db.issues.project_id == project_id)
+        tags = normalize(tags or [])
+        if tags:
+            statement = statement.where(db.issues.id.in_(tagged(tags, match)))
+        if before is not None:
+            ctime, issue_id = before
+            statement = statement.where(
+                sqlmodel.or_(
+                    db.issues.ctime < ctime,
+                    sqlmodel.and_(db.issues.ctime == ctime, db.issues.id < issue_id),
+                )
+            )
+        if after is not None:
+            ctime, issue_id = after
+            statement = statement.where(
+                sqlmodel.or_(
+                    db.issues.ctime > ctime,
+                    sqlmodel.and_(db.issues.ctime == ctime, db.issues.id > issue_id),
+                )
+            )
+            # Walk forward from the cursor so the limit keeps the rows
+            # nearest to it; callers flip them back to newest first.
+            return statement.order_by(db.issues.ctime, db.issues.id)
+        return statement.order_by(db.issues.ctime.desc(), db.issues.id.desc())
+
+    def get_issues(
+        self,
+        project_id: int | None = None,
+        limit: int | None = None,
+        before: tuple[int, int] | None = None,
+        after: tuple[int, int] | None = None,
+        tags: list[str] | None = None,
+        match: str = "all",
+    ):
+        """Return ``(issue, project_name)`` rows, newest first.
+
+        ``before`` and ``after`` are ``(ctime, id)`` keyset cursors: only rows
+        strictly older, or strictly newer, than the cursor are returned.
+        ``tags`` keeps the issues carrying all of them, or any with
+        ``match="any"``.
+        """
+        with self._session() as session:
+            statement = self._issues_statement(
+                sqlmodel.select(db.issues, db.projects.name).join(
+                    db.projects, db.issues.project_id == db.projects.id, isouter=True
+                ),
+                project_id,
+                before,
+                after,
+                tags,
+                match,
+            )
+            if limit is not None:
+                statement = statement.limit(limit)
+            rows = list(session.exec(statement).all())
+            if after is not None:
+                rows.reverse()
+            return rows
+
+    def get_issues_page(
+        self,
+        project_id: int | None = None,
+        limit: int = PAGE_SIZE,
+        before: tuple[int, int] | None = None,
+        after: tuple[int, int] | None = None,
+        tags: list[str] | None = None,
+        match: str = "all",
+    ):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        rows = self.get_issues(
+            project_id, limit + 1, before=before, after=after, tags=tags, match=match
+        )
+        rows, newer, older = _paginate(
+            rows, limit, before, after, lambda row: (row[0].ctime, row[0].id)
+        )
+        return {"issues": rows, "newer": newer, "older": older, "limit": limit}
+
+    def stream_issues_page(
+        self,
+        project_id: int | None = None,
+        limit: int = PAGE_SIZE,
+        before: tuple[int, int] | None = None,
+        after: tuple[int, int] | None = None,
+        tags: list[str] | None = None,
+        match: str = "all",
+    ):
+        """Like ``get_issues_page``, but ``issues`` is an iterator.
+
+        Only the page's keys are read up front, for the cursors and the count;
+        the rows are read when iterated, in their own session and
+        STREAM_BATCH_SIZE at a time.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._session() as session:
+            statement = self._issues_statement(
+                sqlmodel.select(db.issues.ctime, db.issues.id),
+                project_id,
+                before,
+                after,
+                tags,
+                match,
+            )
+            keys = [tuple(key) for key in session.exec(statement.limit(limit + 1))]
+        if after is not None:
+            keys.reverse()
+        keys, newer, older = _paginate(keys, limit, before, after, lambda key: key)
+        return {
+            "issues": self.iter_issues([issue_id for _, issue_id in keys]),
+            "count": len(keys),
+            "newer": newer,
+            "older": older,
+            "limit": limit,
+        }
+
+    def iter_issues(self, issue_ids: list[int]):
+        """Yield ``(issue, project_name)`` for ``issue_ids``, newest first."""
+        if not issue_ids:
+            return
+        with self._session() as session:
             statement = (
                 sqlmodel.select(db.issues, db.projects.name)
                 .join(db.projects, db.issues.project_id == db.projects.id, isouter=True)
-                .join(db.columns, db.issues.column_id == db.columns.id, isouter=True)
-                .where(db.issues.active)
+                .where(db.issues.id.in_(issue_ids))
+                .order_by(db.issues.ctime.desc(), db.issues.id.desc())
+                .execution_options(yield_per=STREAM_BATCH_SIZE)
             )
-            if project_id is not None:
-                statement = statement.where(db.issues.project_id == project_id)
-            statement = statement.order_by(db.issues.ctime)
-            result = session.exec(statement)
-            return list(result.all())
+            yield from session.exec(statement)
 
     def update(self, issue_id: int, **kwargs):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             issue = session.get(db.issues, issue_id)
             if issue:
                 for key, value in kwargs.items():
@@ -164,7 +672,16 @@ class Issue:
                         setattr(issue, key, value)
                 issue.mtime = int(time.time())
                 session.add(issue)
-                session.commit()
+                if "title" in kwargs or "description" in kwargs:
+                    Search(session).index_issue(issue)
+                self._touch(session, issue)
+                self._publish(
+                    session,
+                    issue,
+                    "update",
+                    *[name for name in _UPDATE_FIELDS if name in kwargs],
+                )
+                self._commit(session)
                 session.refresh(issue)
                 return issue
             return None
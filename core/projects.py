@@ -3,23 +3,24 @@ import time
 import sqlmodel
 
 import db
-from core import utils
+from core import cache, utils
+from core.session import Service
 
 
-class Project:
+class Project(Service):
     def create(self, name: str):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             now = int(time.time())
             project = db.projects(
                 name=name, ctime=now, etime=0, checksum=utils.hash(name), mtime=now
             )
             session.add(project)
-            session.commit()
+            self._commit(session)
             session.refresh(project)
             return project
 
     def get_projects(self, limit: int, offset: int):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             result = session.exec(
                 sqlmodel.select(db.projects)
                 .where(db.projects.active)
@@ -29,12 +30,44 @@ class Project:
             return list(result.all())
 
     def get_project(self, project_id: int):
-        with sqlmodel.Session(db.engine) as session:
-            return session.get(db.projects, project_id)
+        with self._session() as session:
+            # Keyed on the version like everything else cached for the project,
+            # so a worker that did not make a change never serves the old row.
+            version = self.get_version(project_id)
+            if version is None:
+                return None
+            return cache.get_or_load(
+                cache.project_key(project_id, version, "project"),
+                lambda: session.get(db.projects, project_id),
+            )
+
+    def get_mtime(self, project_id: int) -> int | None:
+        with self._session() as session:
+            return session.exec(
+                sqlmodel.select(db.projects.mtime).where(db.projects.id == project_id)
+            ).first()
+
+    def get_version(self, project_id: int) -> int | None:
+        """Return the project's change count, which keys everything cached for it."""
+        with self._session() as session:
+            return session.exec(
+                sqlmodel.select(db.projects.version).where(db.projects.id == project_id)
+            ).first()
 
     def update_mtime(self, project_id: int):
-        with sqlmodel.Session(db.engine) as session:
-            project = session.get(db.projects, project_id)
-            project.mtime = int(time.time())
-            session.add(project)
-            session.commit()
+        """Record a change to the project: bump its version, stamp its mtime."""
+        with self._session() as session:
+            now = int(time.time())
+            session.exec(
+                sqlmodel.update(db.projects)
+                .where(db.projects.id == project_id)
+                .values(
+                    version=db.projects.version + 1,
+                    # Never backwards, should the clock be.
+                    mtime=sqlmodel.case(
+                        (db.projects.mtime > now, db.projects.mtime), else_=now
+                    ),
+                )
+            )
+            cache.invalidate_on_commit(session, project_id)
+            self._commit(session)
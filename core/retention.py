@@ -0,0 +1,159 @@
+"""Compact old events out of the ``events`` table.
+
+Run periodically, e.g. nightly from cron:
+
+    python -m core.retention        compact events older than EVENT_RETENTION_DAYS
+    python -m core.retention 30     compact events older than 30 days
+
+For every issue, the start/stop events older than the cutoff are replayed
+once into ``event_segments`` rows plus an ``event_checkpoints`` row holding
+the replay state, which the gantt resumes from, so it draws exactly what it
+drew from the raw events. The raw rows are moved, compressed, to
+``events_archive``, where ``Rollup.rebuild`` still reads them.
+"""
+
+import os
+import sys
+import time
+
+import sqlmodel
+
+import db
+from core import timeline
+from core.events import pack, sink
+from core.session import Service
+
+RETENTION_DAYS = int(os.getenv("EVENT_RETENTION_DAYS", "90"))
+
+
+class Retention(Service):
+    def _archive(self, session: sqlmodel.Session, events_list, project_id, issue_id):
+        session.add(
+            db.events_archive(
+                project_id=project_id,
+                issue_id=issue_id,
+                first_ctime=events_list[0].ctime,
+                last_ctime=events_list[-1].ctime,
+                count=len(events_list),
+                data=pack(events_list),
+            )
+        )
+        session.exec(
+            sqlmodel.delete(db.events).where(
+                db.events.id.in_([event.id for event in events_list])
+            )
+        )
+
+    def _compact_issue(self, session: sqlmodel.Session, issue, before: int) -> int:
+        if not issue.ctime:
+            # Histories without a creation time are anchored at "now" and
+            # cannot be summarized ahead of time.
+            return 0
+        events_list = session.exec(
+            sqlmodel.select(db.events)
+            .where(db.events.issue_id == issue.id)
+            .where(db.events.ctime < before)
+            .order_by(db.events.ctime, db.events.id)
+        ).all()
+        if not events_list:
+            return 0
+
+        columns = timeline.EventColumns(events_list)
+        lo, hi = columns.span(issue.id)
+        checkpoint = session.get(db.event_checkpoints, issue.id)
+        if checkpoint is None and hi > lo:
+            checkpoint = db.event_checkpoints(
+                issue_id=issue.id,
+                project_id=issue.project_id,
+                ctime=before,
+                cursor=issue.ctime,
+            )
+        # An issue that never had start/stop events keeps being drawn from
+        # its own timestamps, so it only gets a checkpoint once it has some.
+        if hi > lo:
+            segments, state = timeline.replay(
+                columns.ctimes,
+                columns.actions,
+                lo,
+                hi,
+                (checkpoint.active_start, checkpoint.cursor, checkpoint.last_stop),
+            )
+            checkpoint.active_start, checkpoint.cursor, checkpoint.last_stop = state
+            checkpoint.ctime = max(checkpoint.ctime, before)
+            checkpoint.events += hi - lo
+            checkpoint.last_event_id = max(
+                checkpoint.last_event_id, columns.ids[hi - 1]
+            )
+            session.add(checkpoint)
+            if segments:
+                session.exec(
+                    sqlmodel.insert(db.event_segments),
+                    params=[
+                        {
+                            "issue_id": issue.id,
+                            "project_id": issue.project_id,
+                            "stime": start,
+                            "etime": end,
+                            "status": status,
+                        }
+                        for start, end, status in segments
+                    ],
+                )
+        self._archive(session, events_list, issue.project_id, issue.id)
+        return len(events_list)
+
+    def _compact_unattached(self, before: int, batch_size: int) -> int:
+        """Archive project-level events, which the gantt never reads."""
+        moved = 0
+        while True:
+            with self._session() as session:
+                events_list = session.exec(
+                    sqlmodel.select(db.events)
+                    .where(db.events.issue_id.is_(None))
+                    .where(db.events.ctime < before)
+                    .order_by(db.events.id)
+                    .limit(batch_size)
+                ).all()
+                if not events_list:
+                    return moved
+                by_project = {}
+                for event in events_list:
+                    by_project.setdefault(event.project_id, []).append(event)
+                for project_id, chunk in by_project.items():
+                    chunk.sort(key=lambda event: (event.ctime, event.id))
+                    self._archive(session, chunk, project_id, None)
+                moved += len(events_list)
+                self._commit(session)
+
+    def compact(self, before: int, batch_size: int = 200) -> int:
+        """Move events older than ``before`` out of ``events``.
+
+        Works through the issues ``batch_size`` at a time, one transaction
+        per batch, and returns how many events were archived.
+        """
+        sink.flush()
+        moved = 0
+        last_id = 0
+        while True:
+            with self._session() as session:
+                batch = session.exec(
+                    sqlmodel.select(db.issues)
+                    .where(db.issues.id > last_id)
+                    .order_by(db.issues.id)
+                    .limit(batch_size)
+                ).all()
+                if not batch:
+                    break
+                for issue in batch:
+                    moved += self._compact_issue(session, issue, before)
+                last_id = batch[-1].id
+                self._commit(session)
+        return moved + self._compact_unattached(before, batch_size * 10)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 or (sys.argv[1:] and not sys.argv[1].isdigit()):
+        sys.exit("usage: python -m core.retention [days]")
+    days = int(sys.argv[1]) if sys.argv[1:] else RETENTION_DAYS
+    moved = Retention().compact(int(time.time()) - days * 86400)
+    print(f"archived {moved} events older than {days} days")
@@ -0,0 +1,229 @@
+import collections
+
+import sqlmodel
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+import db
+from core.events import Event, sink
+from core.session import Service
+
+DAY = 86400
+
+
+def day_of(ts: int) -> int:
+    """Start of the UTC day containing ``ts``."""
+    return ts - ts % DAY
+
+
+def split_days(start: int, end: int):
+    """Yield ``(day, seconds)`` for each UTC day that ``[start, end)`` covers."""
+    while start < end:
+        day = day_of(start)
+        stop = min(end, day + DAY)
+        yield day, stop - start
+        start = stop
+
+
+def parse_logged(log: bytes | None) -> int:
+    try:
+        return max(0, int(log or 0))
+    except ValueError:
+        return 0
+
+
+def _upsert(session: sqlmodel.Session, rows: list[dict]):
+    """Add ``rows`` onto the existing ``(issue_id, day)`` rollups."""
+    if not rows:
+        return
+    table = db.time_rollups.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            tracked_seconds=table.c.tracked_seconds
+            + statement.inserted.tracked_seconds,
+            logged_seconds=table.c.logged_seconds + statement.inserted.logged_seconds,
+        )
+    else:
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["issue_id", "day"],
+            set_={
+                "tracked_seconds": table.c.tracked_seconds
+                + statement.excluded.tracked_seconds,
+                "logged_seconds": table.c.logged_seconds
+                + statement.excluded.logged_seconds,
+            },
+        )
+    session.exec(statement, params=rows)
+
+
+class Rollup(Service):
+    """Per issue, per UTC day totals of tracked (start/stop) and logged time.
+
+    ``Issue.start``, ``Issue.stop`` and ``Issue.log`` add to these rows in the
+    request transaction, and ``rebuild`` recomputes them from ``events``.
+    """
+
+    def add_tracked(self, issue, start: int, end: int) -> int:
+        """Record ``[start, end)`` as tracked on ``issue``; return its length."""
+        with self._session() as session:
+            rows = [
+                {
+                    "issue_id": issue.id,
+                    "project_id": issue.project_id,
+                    "day": day,
+                    "tracked_seconds": seconds,
+                    "logged_seconds": 0,
+                }
+                for day, seconds in split_days(start, end)
+            ]
+            _upsert(session, rows)
+            self._commit(session)
+            return max(0, end - start)
+
+    def add_logged(self, issue, seconds: int, at: int):
+        with self._session() as session:
+            _upsert(
+                session,
+                [
+                    {
+                        "issue_id": issue.id,
+                        "project_id": issue.project_id,
+                        "day": day_of(at),
+                        "tracked_seconds": 0,
+                        "logged_seconds": seconds,
+                    }
+                ],
+            )
+            self._commit(session)
+
+    def rebuild(self, project_id: int | None = None, batch_size: int = 200):
+        """Recompute the rollups of one project, or all of them, from events.
+
+        Buffered events are written first, unless this runs on the caller's
+        session: the sink writes on a connection of its own, which would
+        wait on the caller's open transaction. Such callers flush before
+        starting it.
+        """
+        if self.session is None:
+            sink.flush()
+        with self._session() as session:
+            delete = sqlmodel.delete(db.time_rollups)
+            if project_id is not None:
+                delete = delete.where(db.time_rollups.project_id == project_id)
+            session.exec(delete)
+
+            last_id = 0
+            while True:
+                statement = (
+                    sqlmodel.select(db.issues.id, db.issues.project_id)
+                    .where(db.issues.id > last_id)
+                    .order_by(db.issues.id)
+                    .limit(batch_size)
+                )
+                if project_id is not None:
+                    statement = statement.where(db.issues.project_id == project_id)
+                batch = session.exec(statement).all()
+                if not batch:
+                    break
+                self._replay(session, dict(batch))
+                last_id = batch[-1][0]
+            self._commit(session)
+
+    def _replay(self, session: sqlmodel.Session, projects: dict):
+        totals = collections.defaultdict(lambda: [0, 0])
+        actions = ("start", "stop", "log")
+        result = list(
+            session.exec(
+                sqlmodel.select(db.events)
+                .where(db.events.issue_id.in_(list(projects)))
+                .where(db.events.action_name.in_(actions))
+            )
+        )
+        result.extend(
+            event
+            for event in Event(session).get_archived(list(projects))
+            if event.action_name in actions
+        )
+        result.sort(key=lambda event: (event.issue_id, event.ctime, event.id))
+        current = None
+        opened = None
+        for event in result:
+            if event.issue_id != current:
+                current = event.issue_id
+                opened = None
+            if event.action_name in ("start", "stop"):
+                # Like Issue.start, a restart credits the interval so far.
+                if opened is not None:
+                    for day, seconds in split_days(opened, event.ctime):
+                        totals[event.issue_id, day][0] += seconds
+                opened = event.ctime if event.action_name == "start" else None
+            else:
+                seconds = parse_logged(event.log)
+                if seconds:
+                    totals[event.issue_id, day_of(event.ctime)][1] += seconds
+        _upsert(
+            session,
+            [
+                {
+                    "issue_id": issue_id,
+                    "project_id": projects[issue_id],
+                    "day": day,
+                    "tracked_seconds": tracked,
+                    "logged_seconds": logged,
+                }
+                for (issue_id, day), (tracked, logged) in totals.items()
+            ],
+        )
+
+    def _totals(self, *columns):
+        return (
+            *columns,
+            sqlmodel.func.sum(db.time_rollups.tracked_seconds).label("tracked"),
+            sqlmodel.func.sum(db.time_rollups.logged_seconds).label("logged"),
+        )
+
+    def _window(self, statement, since: int | None, until: int | None):
+        if since is not None:
+            statement = statement.where(db.time_rollups.day >= day_of(since))
+        if until is not None:
+            statement = statement.where(db.time_rollups.day <= until)
+        return statement
+
+    def by_day(
+        self, project_id: int, since: int | None = None, until: int | None = None
+    ):
+        """Return ``(day, tracked, logged)`` for each day with time recorded."""
+        with self._session() as session:
+            statement = self._window(
+                sqlmodel.select(*self._totals(db.time_rollups.day)).where(
+                    db.time_rollups.project_id == project_id
+                ),
+                since,
+                until,
+            )
+            return session.exec(
+                statement.group_by(db.time_rollups.day).order_by(db.time_rollups.day)
+            ).all()
+
+    def by_issue(
+        self, project_id: int, since: int | None = None, until: int | None = None
+    ):
+        """Return ``(issue, tracked, logged)`` per issue, most time first."""
+        with self._session() as session:
+            per_issue = self._window(
+                sqlmodel.select(*self._totals(db.time_rollups.issue_id)).where(
+                    db.time_rollups.project_id == project_id
+                ),
+                since,
+                until,
+            ).group_by(db.time_rollups.issue_id)
+            per_issue = per_issue.subquery("per_issue")
+            total = per_issue.c.tracked + per_issue.c.logged
+            return session.exec(
+                sqlmodel.select(db.issues, per_issue.c.tracked, per_issue.c.logged)
+                .join(per_issue, per_issue.c.issue_id == db.issues.id)
+                .order_by(total.desc(), db.issues.id)
+            ).all()
@@ -0,0 +1,358 @@
+import collections
+import math
+import os
+import re
+import time
+
+import sqlalchemy
+import sqlmodel
+
+import db
+from core.session import Service
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token[:64] for token in _TOKEN.findall(text.lower())]
+
+
+# Detected backend per engine; a migration's connection shares its engine's.
+_backends = {}
+
+
+def backend(bind=None) -> str:
+    """Pick the inverted index for the database behind ``bind``.
+
+    ``bind`` is an engine or connection, ``db.engine`` by default. MySQL
+    uses a FULLTEXT index and SQLite an FTS5 table when the library was
+    built with it; anything else, or SEARCH_BACKEND=python, falls back to
+    the search_terms postings maintained here.
+    """
+    forced = os.getenv("SEARCH_BACKEND")
+    if forced:
+        return forced
+    if bind is None:
+        bind = db.engine
+    if bind.engine not in _backends:
+        _backends[bind.engine] = _detect(bind)
+    return _backends[bind.engine]
+
+
+def _detect(bind) -> str:
+    dialect = bind.dialect.name
+    if dialect == "mysql":
+        return "mysql"
+    if dialect == "sqlite":
+        if isinstance(bind, sqlalchemy.Engine):
+            with bind.connect() as connection:
+                return _detect(connection)
+        options = bind.exec_driver_sql("PRAGMA compile_options").scalars()
+        if "ENABLE_FTS5" in set(options):
+            return "fts5"
+    return "python"
+
+
+def install(connection):
+    """Create the backend's index structures on ``connection``.
+
+    Safe to repeat, like every migration step.
+    """
+    name = backend(connection)
+    if name == "mysql":
+        existing = {
+            index["name"]
+            for index in sqlalchemy.inspect(connection).get_indexes("search_documents")
+        }
+        if "ft_search_documents_body" not in existing:
+            connection.exec_driver_sql(
+                "CREATE FULLTEXT INDEX ft_search_documents_body "
+                "ON search_documents (body)"
+            )
+    elif name == "fts5":
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+            "body, content='search_documents', content_rowid='id')"
+        )
+        connection.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS search_documents_ai "
+            "AFTER INSERT ON search_documents BEGIN "
+            "INSERT INTO search_fts(rowid, body) VALUES (new.id, new.body); END"
+        )
+        connection.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS search_documents_ad "
+            "AFTER DELETE ON search_documents BEGIN "
+            "INSERT INTO search_fts(search_fts, rowid, body) "
+            "VALUES ('delete', old.id, old.body); END"
+        )
+        connection.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS search_documents_au "
+            "AFTER UPDATE ON search_documents BEGIN "
+            "INSERT INTO search_fts(search_fts, rowid, body) "
+            "VALUES ('delete', old.id, old.body); "
+            "INSERT INTO search_fts(rowid, body) VALUES (new.id, new.body); END"
+        )
+
+
+class Search(Service):
+    def _index(
+        self,
+        session: sqlmodel.Session,
+        kind: str,
+        source_id: int,
+        issue_id: int,
+        project_id: int | None,
+        body: str,
+    ):
+        return self._index_many(
+            session, kind, [(source_id, issue_id, project_id, body)]
+        )[0]
+
+    def _index_many(self, session: sqlmodel.Session, kind: str, rows: list[tuple]):
+        """Index ``(source_id, issue_id, project_id, body)`` rows of ``kind``."""
+        existing = {
+            document.source_id: document
+            for document in session.exec(
+                sqlmodel.select(db.search_documents)
+                .where(db.search_documents.kind == kind)
+                .where(db.search_documents.source_id.in_({row[0] for row in rows}))
+            ).all()
+        }
+        now = int(time.time())
+        documents = []
+        for source_id, issue_id, project_id, body in rows:
+            document = existing.get(source_id)
+            if document is None:
+                document = db.search_documents(kind=kind, source_id=source_id)
+                existing[source_id] = document
+            document.issue_id = issue_id
+            document.project_id = project_id
+            document.body = body
+            document.mtime = now
+            documents.append(document)
+        session.add_all(documents)
+        session.flush()
+
+        if backend(session.get_bind()) == "python":
+            ids = {document.id for document in documents}
+            session.exec(
+                sqlmodel.delete(db.search_terms).where(
+                    db.search_terms.document_id.in_(ids)
+                )
+            )
+            postings = {
+                document.id: collections.Counter(tokenize(document.body))
+                for document in documents
+            }
+            params = [
+                {"term": term, "document_id": document_id, "count": count}
+                for document_id, counts in postings.items()
+                for term, count in counts.items()
+            ]
+            if params:
+                session.exec(sqlmodel.insert(db.search_terms), params=params)
+        return documents
+
+    def index_issue(self, issue):
+        with self._session() as session:
+            body = f"{issue.title}\n{issue.description or ''}"
+            document = self._index(
+                session, "issue", issue.id, issue.id, issue.project_id, body
+            )
+            self._commit(session)
+            return document
+
+    def index_issues(self, issues):
+        """Index several issues with one lookup and one flush."""
+        if not issues:
+            return []
+        with self._session() as session:
+            documents = self._index_many(
+                session,
+                "issue",
+                [
+                    (
+                        issue.id,
+                        issue.id,
+                        issue.project_id,
+                        f"{issue.title}\n{issue.description or ''}",
+                    )
+                    for issue in issues
+                ],
+            )
+            self._commit(session)
+            return documents
+
+    def index_comment(self, comment):
+        with self._session() as session:
+            issue = session.get(db.issues, comment.issue_id)
+            body = (comment.comment or b"").decode("utf-8", "ignore")
+            document = self._index(
+                session,
+                "comment",
+                comment.id,
+                comment.issue_id,
+                issue.project_id if issue else None,
+                body,
+            )
+            self._commit(session)
+            return document
+
+    def rebuild(self, batch_size: int = 500, project_id: int | None = None):
+        """Re-index every issue and comment, e.g. after switching backends.
+
+        With ``project_id``, only that project's issues and their comments.
+        """
+        with self._session() as session:
+            search = Search(session)
+            in_project = sqlmodel.select(db.issues.id).where(
+                db.issues.project_id == project_id
+            )
+            for model, index, scope in (
+                (db.issues, search.index_issue, db.issues.project_id == project_id),
+                (
+                    db.comments,
+                    search.index_comment,
+                    db.comments.issue_id.in_(in_project),
+                ),
+            ):
+                last_id = 0
+                while True:
+                    statement = sqlmodel.select(model).where(model.id > last_id)
+                    if project_id is not None:
+                        statement = statement.where(scope)
+                    batch = session.exec(
+                        statement.order_by(model.id).limit(batch_size)
+                    ).all()
+                    if not batch:
+                        break
+                    for row in batch:
+                        index(row)
+                    last_id = batch[-1].id
+            self._commit(session)
+
+    def _matches(self, session: sqlmodel.Session, terms: list[str]):
+        """Return an ``(id, score)`` subquery of the matching documents."""
+        name = backend(session.get_bind())
+        if name == "mysql":
+            # InnoDB drops words shorter than innodb_ft_min_token_size (3).
+            terms = [term for term in terms if len(term) >= 3] or terms
+            return (
+                sqlalchemy.text(
+                    "SELECT id, MATCH(body) AGAINST (:q IN BOOLEAN MODE) AS score "
+                    "FROM search_documents "
+                    "WHERE MATCH(body) AGAINST (:q IN BOOLEAN MODE)"
+                )
+                .bindparams(q=" ".join(f"+{term}*" for term in terms))
+                .columns(id=sqlalchemy.Integer, score=sqlalchemy.Float)
+                .subquery("matches")
+            )
+        if name == "fts5":
+            return (
+                sqlalchemy.text(
+                    # rank is bm25() by default; unlike the function it stays
+                    # usable once SQLite flattens this subquery into a join.
+                    "SELECT rowid AS id, -rank AS score "
+                    "FROM search_fts WHERE search_fts MATCH :q"
+                )
+                .bindparams(q=" ".join(f'"{term}"' for term in terms))
+                .columns(id=sqlalchemy.Integer, score=sqlalchemy.Float)
+                .subquery("matches")
+            )
+
+        # Postings fallback: AND the terms together and weight each by its
+        # inverse document frequency.
+        postings = db.search_terms
+        total = session.exec(
+            sqlmodel.select(sqlmodel.func.count()).select_from(db.search_documents)
+        ).one()
+        frequencies = dict(
+            session.exec(
+                sqlmodel.select(postings.term, sqlmodel.func.count())
+                .where(postings.term.in_(terms))
+                .group_by(postings.term)
+            ).all()
+        )
+        weight = sqlalchemy.case(
+            {
+                term: math.log((total + 1) / (frequencies.get(term, 0) + 0.5))
+                for term in terms
+            },
+            value=postings.term,
+            else_=0,
+        )
+        return (
+            sqlmodel.select(
+                postings.document_id.label("id"),
+                sqlmodel.func.sum(postings.count * weight).label("score"),
+            )
+            .where(postings.term.in_(terms))
+            .group_by(postings.document_id)
+            .having(sqlmodel.func.count(postings.term) == len(set(terms)))
+            .subquery("matches")
+        )
+
+    def search(
+        self,
+        query: str,
+        project_id: int | None = None,
+        status: int | None = None,
+        tag: str | None = None,
+        limit: int = PAGE_SIZE,
+        offset: int = 0,
+    ):
+        """Return issues matching every word of ``query``, best match first.
+
+        An issue ranks by its best matching document, which is either its own
+        title and description or one of its comments.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        terms = tokenize(query)
+        if not terms:
+            return {"results": [], "has_more": False, "limit": limit, "offset": offset}
+
+        with self._session() as session:
+            matches = self._matches(session, terms)
+            per_issue = (
+                sqlmodel.select(
+                    db.search_documents.issue_id,
+                    sqlmodel.func.max(matches.c.score).label("score"),
+                )
+                .join(matches, matches.c.id == db.search_documents.id)
+                .group_by(db.search_documents.issue_id)
+                .subquery("per_issue")
+            )
+            statement = (
+                sqlmodel.select(db.issues, db.projects.name, per_issue.c.score)
+                .join(per_issue, per_issue.c.issue_id == db.issues.id)
+                .join(db.projects, db.issues.project_id == db.projects.id, isouter=True)
+                .where(db.issues.active == sqlmodel.true())
+            )
+            if project_id is not None:
+                statement = statement.where(db.issues.project_id == project_id)
+            if status is not None:
+                statement = statement.where(db.issues.status == status)
+            if tag:
+                statement = statement.where(
+                    sqlmodel.select(db.issues_tags.id)
+                    .join(db.tags, db.tags.id == db.issues_tags.tag_id)
+                    .where(db.issues_tags.issue_id == db.issues.id)
+                    .where(db.tags.value == tag)
+                    .exists()
+                )
+            statement = (
+                statement.order_by(per_issue.c.score.desc(), db.issues.id.desc())
+                .limit(limit + 1)
+                .offset(offset)
+            )
+            rows = list(session.exec(statement).all())
+            return {
+                "results": rows[:limit],
+                "has_more": len(rows) > limit,
+                "limit": limit,
+                "offset": offset,
+            }
@@ -0,0 +1,27 @@
+import contextlib
+
+import sqlmodel
+
+import db
+
+
+class Service:
+    def __init__(self, session: sqlmodel.Session | None = None):
+        self.session = session
+
+    @contextlib.contextmanager
+    def _session(self):
+        """Yield the shared request session, or a private one for standalone use."""
+        if self.session is not None:
+            yield self.session
+            return
+        with sqlmodel.Session(db.engine) as session:
+            yield session
+
+    def _commit(self, session: sqlmodel.Session):
+        # A shared session belongs to the caller's unit of work; only flush so
+        # generated ids and defaults are visible and let the owner commit.
+        if session is self.session:
+            session.flush()
+        else:
+            session.commit()
@@ -1,44 +1,142 @@
 import time
 
 import sqlmodel
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 
 import db
+from core.projects import Project
+from core.session import Service
 
 
-class Tag:
-    def tag_issue(self, issue_id: int, tag: str):
-        with sqlmodel.Session(db.engine) as session:
+def insert_ignore(session: sqlmodel.Session, table, rows: list[dict], unique):
+    """Insert ``rows``, skipping those that collide on the ``unique`` columns."""
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql.insert(table).prefix_with("IGNORE")
+    else:
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        statement = insert(table).on_conflict_do_nothing(index_elements=unique)
+    session.exec(statement, params=rows)
+
+
+def normalize(values) -> list[str]:
+    """Strip tag values and drop blanks and duplicates, keeping their order."""
+    return list(dict.fromkeys(value.strip() for value in values if value.strip()))
+
+
+class Tag(Service):
+    def _projects_of(self, session: sqlmodel.Session, issue_ids) -> dict:
+        return dict(
+            session.exec(
+                sqlmodel.select(db.issues.id, db.issues.project_id).where(
+                    db.issues.id.in_(issue_ids)
+                )
+            ).all()
+        )
+
+    def _touch(self, session: sqlmodel.Session, projects: dict):
+        for project_id in sorted({pid for pid in projects.values() if pid}):
+            Project(session).update_mtime(project_id)
+
+    def tag_issues(self, issue_ids: list[int], values: list[str]):
+        """Attach every tag in ``values`` to every issue in ``issue_ids``.
+
+        Missing tags are created. Links that already exist are left alone,
+        so the call is idempotent. Returns the tags, or an empty list when
+        none of the issues exist.
+        """
+        values = normalize(values)
+        with self._session() as session:
+            projects = self._projects_of(session, set(issue_ids))
+            if not projects or not values:
+                return []
             now = int(time.time())
-            issue = session.get(db.issues, issue_id)
-            if issue is None:
-                return None
-            existing_tag = session.exec(
-                sqlmodel.select(db.tags).where(db.tags.value == tag)
-            ).first()
-            if existing_tag:
-                existing_link = session.exec(
-                    sqlmodel.select(db.issues_tags).where(
-                        db.issues_tags.issue_id == issue_id,
-                        db.issues_tags.tag_id == existing_tag.id,
+            insert_ignore(
+                session,
+                db.tags.__table__,
+                [{"value": value, "ctime": now} for value in values],
+                ["value"],
+            )
+            tag_ids = session.exec(
+                sqlmodel.select(db.tags.id).where(db.tags.value.in_(values))
+            ).all()
+            insert_ignore(
+                session,
+                db.issues_tags.__table__,
+                [
+                    {"issue_id": issue_id, "tag_id": tag_id}
+                    for issue_id in sorted(projects)
+                    for tag_id in tag_ids
+                ],
+                ["issue_id", "tag_id"],
+            )
+            self._touch(session, projects)
+            self._commit(session)
+            return list(
+                session.exec(
+                    sqlmodel.select(db.tags).where(db.tags.id.in_(tag_ids))
+                ).all()
+            )
+
+    def untag_issues(self, issue_ids: list[int], values: list[str]) -> int:
+        """Detach the tags in ``values`` from ``issue_ids``; return how many."""
+        values = normalize(values)
+        with self._session() as session:
+            projects = self._projects_of(session, set(issue_ids))
+            if not projects or not values:
+                return 0
+            removed = session.exec(
+                sqlmodel.delete(db.issues_tags)
+                .where(db.issues_tags.issue_id.in_(list(projects)))
+                .where(
+                    db.issues_tags.tag_id.in_(
+                        sqlmodel.select(db.tags.id).where(db.tags.value.in_(values))
                     )
-                ).first()
-                if existing_link:
-                    return None
-                issue_tag = db.issues_tags(issue_id=issue_id, tag_id=existing_tag.id)
-                session.add(issue_tag)
-                session.commit()
-                return existing_tag
-            new_tag = db.tags(value=tag, ctime=now)
-            session.add(new_tag)
-            session.commit()
-            session.refresh(new_tag)
-            issue_tag = db.issues_tags(issue_id=issue_id, tag_id=new_tag.id)
-            session.add(issue_tag)
-            session.commit()
-            return new_tag
+                )
+            ).rowcount
+            if removed:
+                self._touch(session, projects)
+            self._commit(session)
+            return removed
+
+    def tag_issue(self, issue_id: int, tag: str):
+        tags_list = self.tag_issues([issue_id], [tag])
+        return tags_list[0] if tags_list else None
+
+    def untag_issue(self, issue_id: int, tag: str) -> bool:
+        return self.untag_issues([issue_id], [tag]) > 0
+
+    def get_counts(self, project_id: int | None = None, limit: int | None = None):
+        """Return ``(tag, issue_count)`` rows, most used first.
+
+        Counted from ``ix_issues_tags_tag_issue`` alone unless ``project_id``
+        asks for one project's active issues.
+        """
+        with self._session() as session:
+            count = sqlmodel.func.count(db.issues_tags.issue_id).label("issue_count")
+            per_tag = sqlmodel.select(db.issues_tags.tag_id, count).group_by(
+                db.issues_tags.tag_id
+            )
+            if project_id is not None:
+                per_tag = (
+                    per_tag.join(db.issues, db.issues.id == db.issues_tags.issue_id)
+                    .where(db.issues.project_id == project_id)
+                    .where(db.issues.active == sqlmodel.true())
+                )
+            per_tag = per_tag.subquery("per_tag")
+            statement = (
+                sqlmodel.select(db.tags, per_tag.c.issue_count)
+                .join(per_tag, per_tag.c.tag_id == db.tags.id)
+                .order_by(per_tag.c.issue_count.desc(), db.tags.value)
+            )
+            if limit is not None:
+                statement = statement.limit(limit)
+            return list(session.exec(statement).all())
 
     def get_tags_by_issue_id(self, issue_id: int):
-        with sqlmodel.Session(db.engine) as session:
+        with self._session() as session:
             statement = (
                 sqlmodel.select(db.tags, db.issues_tags)
                 .join(db.issues_tags, db.tags.id == db.issues_tags.tag_id)
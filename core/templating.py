@@ -0,0 +1,116 @@
+"""Jinja environment and filters for the HTML pages.
+
+TEMPLATE_MODE=production turns off the per-render mtime check, keeps
+compiled templates in an on-disk bytecode cache shared by every worker and
+restart, and compiles all templates up front so no request pays for it. The
+default, development, picks up template edits on the next render.
+"""
+
+import functools
+import os
+import pathlib
+import tempfile
+from datetime import datetime, timezone
+
+import jinja2
+from fastapi.templating import Jinja2Templates
+
+from core import assets
+from core.issues import Status
+
+TEMPLATE_MODE = os.getenv("TEMPLATE_MODE", "development")
+TEMPLATE_CACHE_DIR = os.getenv(
+    "TEMPLATE_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), f"cado-jinja-{os.getuid()}"),
+)
+# Distinct timestamps and durations a worker remembers the formatting of.
+FILTER_CACHE_SIZE = 8192
+# Characters of a streamed page sent at once; Jinja yields far smaller pieces.
+STREAM_CHUNK = 16 * 1024
+
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def format_timestamp_utc(timestamp):
+    if timestamp is None or timestamp <= 0:
+        return ""
+    try:
+        dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        return dt.strftime("%Y-%m-%d %H:%M:%S UTC")
+    except (ValueError, TypeError, OSError):
+        return str(timestamp)
+
+
+@functools.lru_cache(maxsize=64)
+def format_status(status):
+    return Status(status).name
+
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def format_duration(seconds):
+    if seconds is None:
+        return ""
+    try:
+        total = max(0, int(seconds))
+    except (TypeError, ValueError):
+        return str(seconds)
+    hours = total // 3600
+    minutes = (total % 3600) // 60
+    secs = total % 60
+    if hours:
+        return f"{hours}h {minutes}m {secs}s"
+    if minutes:
+        return f"{minutes}m {secs}s"
+    return f"{secs}s"
+
+
+def create_environment(
+    directory: str = "templates",
+    production: bool = TEMPLATE_MODE == "production",
+    cache_dir: str = TEMPLATE_CACHE_DIR,
+) -> jinja2.Environment:
+    options = {}
+    if production:
+        pathlib.Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        options["bytecode_cache"] = jinja2.FileSystemBytecodeCache(cache_dir)
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(directory),
+        autoescape=True,
+        auto_reload=not production,
+        # Room for every template, so none is ever evicted and reloaded.
+        cache_size=-1,
+        **options,
+    )
+    env.filters["utc"] = format_timestamp_utc
+    env.filters["status"] = format_status
+    env.filters["duration"] = format_duration
+    env.globals["static_url"] = assets.static_url
+    if production:
+        precompile(env)
+    return env
+
+
+def precompile(env: jinja2.Environment) -> int:
+    """Load every template into ``env``; return how many there are."""
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def generate(template: jinja2.Template, context: dict, chunk_size: int = STREAM_CHUNK):
+    """Render ``template`` piecewise, in chunks of about ``chunk_size``."""
+    pending = []
+    size = 0
+    for piece in template.generate(context):
+        pending.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield "".join(pending)
+
+
+def create_templates(directory: str = "templates", **options) -> Jinja2Templates:
+    return Jinja2Templates(env=create_environment(directory, **options))
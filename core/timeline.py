@@ -0,0 +1,337 @@
+import array
+import threading
+import time
+from collections import OrderedDict
+
+from core.issues import Status
+
+START = 1
+STOP = 2
+_ACTIONS = {"start": START, "stop": STOP}
+
+CACHE_SIZE = 10000
+
+# Horizontal resolution the gantt page downsamples to, and how many issue
+# rows it renders at most.
+WIDTH = 1000
+MAX_ROWS = 500
+
+PENDING = int(Status.PENDING)
+ACTIVE = int(Status.ACTIVE)
+CLOSED = int(Status.CLOSED)
+
+STATUS_LABELS = [
+    (int(Status.PENDING), "PENDING"),
+    (int(Status.ACTIVE), "ACTIVE"),
+    (int(Status.REVIEWING), "REVIEWING"),
+    (int(Status.CLOSED), "CLOSED"),
+]
+
+
+class EventColumns:
+    """Start/stop events of many issues as parallel arrays, grouped by issue.
+
+    Rows are sorted by (issue_id, ctime, id) once, so each issue's history is
+    a contiguous ``[lo, hi)`` slice of ``ctimes``/``actions``/``ids``.
+    """
+
+    def __init__(self, events_list):
+        ordered = sorted(
+            (
+                event
+                for event in events_list
+                if event.issue_id is not None and event.action_name in _ACTIONS
+            ),
+            key=lambda event: (int(event.issue_id), event.ctime, event.id),
+        )
+        self.ctimes = array.array("q", (event.ctime for event in ordered))
+        self.actions = array.array("b", (_ACTIONS[e.action_name] for e in ordered))
+        self.ids = array.array("q", (event.id for event in ordered))
+        self.spans = {}
+        lo = 0
+        for hi in range(1, len(ordered) + 1):
+            issue_id = int(ordered[lo].issue_id)
+            if hi == len(ordered) or int(ordered[hi].issue_id) != issue_id:
+                self.spans[issue_id] = (lo, hi)
+                lo = hi
+
+    def span(self, issue_id: int) -> tuple[int, int]:
+        return self.spans.get(int(issue_id), (0, 0))
+
+
+def replay(ctimes, actions, lo: int, hi: int, state: tuple):
+    """Advance ``state`` over events ``[lo, hi)`` and return the new segments.
+
+    ``state`` is ``(active_start, cursor, last_stop)``: when the running
+    interval began, where the next idle segment starts and the last stop.
+    A start while running and a stop while idle change nothing but the
+    cursor, exactly as the gantt has always drawn them.
+    """
+    active_start, cursor, last_stop = state
+    segments = []
+    for i in range(lo, hi):
+        at = ctimes[i]
+        if actions[i] == START:
+            if active_start is None:
+                if at > cursor:
+                    status = PENDING if last_stop is None else CLOSED
+                    segments.append((cursor, at, status))
+                active_start = at
+        else:
+            if active_start is not None:
+                segments.append((active_start, at, ACTIVE))
+                active_start = None
+            cursor = at
+            last_stop = at
+    return segments, (active_start, cursor, last_stop)
+
+
+def _segments(
+    issue,
+    columns: EventColumns,
+    lo: int,
+    hi: int,
+    now: int | None,
+    history: tuple | None = None,
+):
+    """Replay one issue's history into ``(start, end, status)`` segments.
+
+    ``history`` is the ``(checkpoint, segments)`` left by compacting older
+    events (see ``core.retention``); the replay resumes from it.
+
+    With ``now=None`` the result does not depend on the clock: segments still
+    running end in ``None`` and are closed at render time, which is what
+    makes them cacheable.
+    """
+    segments = []
+    ctime = issue.ctime or now
+    stime = issue.stime or 0
+    etime = issue.etime or 0
+    mtime = issue.mtime or ctime
+    running_end = now if issue.status == ACTIVE else mtime
+
+    if hi > lo or history is not None:
+        state = (None, ctime, None)
+        if history is not None:
+            checkpoint, compacted = history
+            segments.extend(compacted)
+            state = (checkpoint.active_start, checkpoint.cursor, checkpoint.last_stop)
+        more, (active_start, cursor, last_stop) = replay(
+            columns.ctimes, columns.actions, lo, hi, state
+        )
+        segments.extend(more)
+        if active_start is not None:
+            segments.append((active_start, running_end, ACTIVE))
+        else:
+            tail_end = mtime if mtime else now
+            if tail_end > cursor:
+                status = CLOSED if last_stop is not None else PENDING
+                segments.append((cursor, tail_end, status))
+    else:
+        if stime and stime > ctime:
+            segments.append((ctime, stime, PENDING))
+        if stime:
+            active_end = etime if etime else running_end
+            if active_end is not None and active_end < stime:
+                active_end = stime
+            segments.append((stime, active_end, ACTIVE))
+        else:
+            pending_end = mtime if mtime > ctime else ctime
+            segments.append((ctime, pending_end, PENDING))
+        if etime:
+            closed_end = mtime if mtime and mtime >= etime else etime
+            segments.append((etime, closed_end, CLOSED))
+    return segments
+
+
+class SegmentCache:
+    """LRU of per-issue segments keyed on everything they are derived from."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, issue_id: int, signature: tuple):
+        with self._lock:
+            entry = self._entries.get(issue_id)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(issue_id)
+            return entry[1]
+
+    def put(self, issue_id: int, signature: tuple, segments: list):
+        with self._lock:
+            self._entries[issue_id] = (signature, segments)
+            self._entries.move_to_end(issue_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+segment_cache = SegmentCache()
+
+
+def issue_segments(
+    issue,
+    columns: EventColumns,
+    now: int,
+    cache: bool = True,
+    history: tuple | None = None,
+):
+    lo, hi = columns.span(issue.id)
+    if not issue.ctime or not cache:
+        # Histories without a creation time are anchored at "now".
+        return _segments(issue, columns, lo, hi, now, history)
+    checkpoint = history[0] if history is not None else None
+    signature = (
+        issue.ctime,
+        issue.stime,
+        issue.etime,
+        issue.mtime,
+        issue.status,
+        hi - lo,
+        columns.ids[hi - 1] if hi > lo else 0,
+        checkpoint.events if checkpoint is not None else 0,
+        checkpoint.last_event_id if checkpoint is not None else 0,
+    )
+    segments = segment_cache.get(issue.id, signature)
+    if segments is None:
+        segments = _segments(issue, columns, lo, hi, None, history)
+        segment_cache.put(issue.id, signature, segments)
+    return segments
+
+
+def _downsample(segments: list, resolution: float) -> list:
+    """Merge a row's segments that could not be told apart at ``resolution``.
+
+    Touching segments of the same status are joined, and a segment shorter
+    than ``resolution`` seconds is folded into the one before it.
+    """
+    merged = []
+    for start, end, status in segments:
+        if merged:
+            prev_start, prev_end, prev_status = merged[-1]
+            if start <= prev_end and (
+                status == prev_status or end - start < resolution
+            ):
+                merged[-1] = (prev_start, max(prev_end, end), prev_status)
+                continue
+        merged.append((start, end, status))
+    return merged
+
+
+def build(
+    board_data,
+    events_list,
+    now: int | None = None,
+    since: int | None = None,
+    until: int | None = None,
+    width: int | None = None,
+    max_rows: int | None = None,
+    history: dict | None = None,
+):
+    """Lay out the gantt rows for a loaded board.
+
+    ``since``/``until`` clip the chart to a window, dropping issues with
+    nothing inside it; ``width`` merges segments narrower than one of that
+    many steps across the axis; ``max_rows`` caps the rows rendered.
+    ``history`` maps issue ids to their compacted ``(checkpoint, segments)``.
+
+    Returns the template context used by ``gantt.html`` and ``board.html``.
+    """
+    now = int(time.time()) if now is None else now
+    columns = EventColumns(events_list)
+    windowed = since is not None or until is not None
+    history = history or {}
+
+    rows = []
+    for item in board_data:
+        col = item["column"]
+        for issue in item["issues"]:
+            segments = []
+            # Windowed event lists are partial histories, so keep them out of
+            # the cache that holds full ones.
+            for start, end, status in issue_segments(
+                issue, columns, now, cache=not windowed, history=history.get(issue.id)
+            ):
+                if end is None:
+                    end = now
+                if end < start:
+                    end = start
+                if since is not None:
+                    if end < since:
+                        continue
+                    start = max(start, since)
+                if until is not None:
+                    if start > until:
+                        continue
+                    end = min(end, until)
+                segments.append((start, end, status))
+            if windowed and not segments:
+                continue
+            rows.append({"issue": issue, "column_name": col.name, "segments": segments})
+
+    hidden_rows = 0
+    if max_rows is not None and len(rows) > max_rows:
+        hidden_rows = len(rows) - max_rows
+        rows = rows[:max_rows]
+
+    min_ts = None
+    max_ts = None
+    for row in rows:
+        for start, end, _ in row["segments"]:
+            min_ts = start if min_ts is None else min(min_ts, start)
+            max_ts = end if max_ts is None else max(max_ts, end)
+    if rows and since is not None:
+        min_ts = since
+    if rows and until is not None:
+        max_ts = until
+
+    duration = max(0, (max_ts or 0) - (min_ts or 0))
+    for row in rows:
+        segments = row["segments"]
+        if width and duration:
+            segments = _downsample(segments, duration / width)
+        row["segments"] = []
+        for start, end, status in segments:
+            if duration == 0:
+                left_pct = 0
+                width_pct = 100
+            else:
+                left_pct = (start - min_ts) / duration * 100
+                width_pct = (end - start) / duration * 100
+                width_pct = max(1.0, width_pct)
+            row["segments"].append(
+                {
+                    "start": start,
+                    "end": end,
+                    "status": status,
+                    "left_pct": min(100, max(0, left_pct)),
+                    "width_pct": min(100, max(1.0, width_pct)),
+                }
+            )
+
+    ticks = []
+    now_pct = None
+    if min_ts is not None and max_ts is not None and duration > 0:
+        for i in range(6):
+            pct = i * 20
+            ts = int(min_ts + (duration * (i / 5)))
+            ticks.append({"pct": pct, "ts": ts})
+        if not windowed or min_ts <= now <= max_ts:
+            now_pct = (now - min_ts) / duration * 100
+            now_pct = min(100, max(0, now_pct))
+
+    return {
+        "rows": rows,
+        "hidden_rows": hidden_rows,
+        "min_ts": min_ts,
+        "max_ts": max_ts,
+        "ticks": ticks,
+        "now_pct": now_pct,
+        "status_labels": STATUS_LABELS,
+    }
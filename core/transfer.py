@@ -0,0 +1,329 @@
+"""Move a project between cado instances as newline-delimited JSON.
+
+    python -m core.transfer export 3 > project-3.ndjson.gz
+    python -m core.transfer import project-3.ndjson.gz
+
+The first line is a header; every other line is ``{"table": ..., "row": ...}``
+for the project, its columns, swimlanes, tags, issues, tag links, comments
+and events, in that order, so an import never meets a row before the rows it
+points to. Exports are read through server-side cursors ``BATCH_SIZE`` rows
+at a time and archived events are unpacked one blob at a time, so memory
+stays flat however long the history is. Imports create a new project, remap
+every id and write the high-volume tables with batched ``executemany``.
+"""
+
+import gzip
+import json
+import sys
+import time
+import zlib
+
+import sqlalchemy
+import sqlmodel
+
+import db
+from core.events import sink, unpack
+from core.rollups import Rollup
+from core.search import Search
+from core.session import Service
+from core.tags import insert_ignore
+
+FORMAT = "cado-project"
+VERSION = 1
+BATCH_SIZE = 1000
+
+
+def _encode(table, row) -> dict:
+    # Binary columns travel as latin-1 text, like events.pack.
+    return {
+        key: value.decode("latin-1") if isinstance(value, bytes) else value
+        for key, value in row.items()
+        if key in table.c
+    }
+
+
+def _decode(table, row: dict) -> dict:
+    decoded = {}
+    for key, value in row.items():
+        column = table.c.get(key)
+        if column is None:
+            continue
+        if value is not None and column.type.python_type is bytes:
+            value = value.encode("latin-1")
+        decoded[key] = value
+    return decoded
+
+
+def _line(table_name: str, row: dict) -> bytes:
+    return (
+        json.dumps({"table": table_name, "row": row}, separators=(",", ":")) + "\n"
+    ).encode()
+
+
+def gzipped(chunks):
+    """Gzip a stream of byte chunks on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def read_lines(fileobj):
+    """Yield the lines of a plain or gzipped export opened in binary mode."""
+    if fileobj.read(2) == b"\x1f\x8b":
+        fileobj.seek(0)
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode="rb")
+    else:
+        fileobj.seek(0)
+    for line in fileobj:
+        if line.strip():
+            yield line
+
+
+class Transfer(Service):
+    def _stream(self, session: sqlmodel.Session, statement):
+        # A server-side cursor where the driver has one, fetched in batches.
+        statement = statement.execution_options(yield_per=BATCH_SIZE)
+        yield from session.connection().execute(statement).mappings()
+
+    def export_project(self, project_id: int):
+        """Yield the export of ``project_id`` as NDJSON lines (bytes)."""
+        sink.flush()
+        with self._session() as session:
+            issue_ids = sqlalchemy.select(db.issues.id).where(
+                db.issues.project_id == project_id
+            )
+            tag_ids = sqlalchemy.select(db.issues_tags.tag_id).where(
+                db.issues_tags.issue_id.in_(issue_ids)
+            )
+            yield (
+                json.dumps(
+                    {"format": FORMAT, "version": VERSION, "project_id": project_id}
+                )
+                + "\n"
+            ).encode()
+            for model, where in (
+                (db.projects, db.projects.id == project_id),
+                (db.columns, db.columns.project_id == project_id),
+                (db.swimlanes, db.swimlanes.project_id == project_id),
+                (db.tags, db.tags.id.in_(tag_ids)),
+                (db.issues, db.issues.project_id == project_id),
+                (db.issues_tags, db.issues_tags.issue_id.in_(issue_ids)),
+            ):
+                table = model.__table__
+                statement = sqlalchemy.select(table).where(where).order_by(table.c.id)
+                for row in self._stream(session, statement):
+                    yield _line(table.name, _encode(table, row))
+
+            comments = db.comments.__table__
+            statement = (
+                sqlalchemy.select(comments, db.users.username)
+                .join(db.users, comments.c.user_id == db.users.id, isouter=True)
+                .where(comments.c.issue_id.in_(issue_ids))
+                .order_by(comments.c.id)
+            )
+            for row in self._stream(session, statement):
+                yield _line(
+                    "comments", {**_encode(comments, row), "username": row["username"]}
+                )
+
+            events = db.events.__table__
+            statement = (
+                sqlalchemy.select(events)
+                .where(events.c.project_id == project_id)
+                .order_by(events.c.id)
+            )
+            for row in self._stream(session, statement):
+                yield _line("events", _encode(events, row))
+            # Compacted history goes out as plain events; the importing side
+            # replays it like any other.
+            statement = (
+                sqlalchemy.select(db.events_archive.data)
+                .where(db.events_archive.project_id == project_id)
+                .order_by(db.events_archive.id)
+            )
+            for row in self._stream(session, statement):
+                for event in unpack(row["data"]):
+                    yield _line(
+                        "events",
+                        _encode(
+                            events, {c.name: getattr(event, c.name) for c in events.c}
+                        ),
+                    )
+
+    def import_project(self, lines, name: str | None = None):
+        """Create a project from export ``lines``; return it.
+
+        Raises ValueError on a malformed export; nothing is written then.
+        """
+        lines = iter(lines)
+        try:
+            header = json.loads(next(lines))
+        except (StopIteration, ValueError):
+            raise ValueError("not a cado project export")
+        if header.get("format") != FORMAT or header.get("version") != VERSION:
+            raise ValueError("not a cado project export")
+
+        # The rollups rebuilt below replay the events, so buffered ones must
+        # be written, and before this session's write transaction holds the
+        # database.
+        sink.flush()
+        with self._session() as session:
+            loader = _Loader(session, name)
+            for number, line in enumerate(lines, start=2):
+                try:
+                    record = json.loads(line)
+                    loader.add(record["table"], record["row"])
+                except (ValueError, KeyError, TypeError) as error:
+                    raise ValueError(f"line {number}: {error!r}") from None
+            if loader.project_id is None:
+                raise ValueError("export holds no project")
+            loader.flush()
+            Rollup(session).rebuild(loader.project_id)
+            Search(session).rebuild(project_id=loader.project_id)
+            self._commit(session)
+            return session.get(db.projects, loader.project_id)
+
+
+class _Loader:
+    """Insert export rows under new ids, batching the bulky tables."""
+
+    def __init__(self, session: sqlmodel.Session, name: str | None):
+        self.session = session
+        self.name = name
+        self.project_id = None
+        self.ids = {"columns": {}, "swimlanes": {}, "issues": {}, "tags": {}}
+        self.pending_tags = {}
+        self.users = {}
+        self.batches = {"issues_tags": [], "comments": [], "events": []}
+
+    def _insert(self, model, row: dict) -> int:
+        result = self.session.exec(sqlmodel.insert(model).values(**row))
+        return result.inserted_primary_key[0]
+
+    def _remap(self, kind: str, old_id):
+        if old_id is None:
+            return None
+        return self.ids[kind][old_id]
+
+    def _resolve_tags(self):
+        values = self.pending_tags
+        self.pending_tags = {}
+        now = int(time.time())
+        insert_ignore(
+            self.session,
+            db.tags.__table__,
+            [{"value": value, "ctime": now} for value in set(values.values())],
+            ["value"],
+        )
+        by_value = dict(
+            self.session.exec(
+                sqlmodel.select(db.tags.value, db.tags.id).where(
+                    db.tags.value.in_(set(values.values()))
+                )
+            ).all()
+        )
+        for old_id, value in values.items():
+            self.ids["tags"][old_id] = by_value[value]
+
+    def _user_id(self, username: str | None) -> int:
+        username = username or "anonymous"
+        if username not in self.users:
+            user_id = self.session.exec(
+                sqlmodel.select(db.users.id)
+                .where(db.users.username == username)
+                .order_by(db.users.id)
+            ).first()
+            if user_id is None:
+                user_id = self._insert(db.users, {"username": username, "token": ""})
+            self.users[username] = user_id
+        return self.users[username]
+
+    def add(self, table_name: str, row: dict):
+        if table_name == "projects":
+            if self.project_id is not None:
+                raise ValueError("more than one project")
+            row = _decode(db.projects.__table__, row)
+            row.pop("id")
+            if self.name:
+                row["name"] = self.name
+            row["mtime"] = int(time.time())
+            self.project_id = self._insert(db.projects, row)
+            return
+        if self.project_id is None:
+            raise ValueError(f"{table_name} row before the project")
+
+        if table_name in ("columns", "swimlanes"):
+            model = getattr(db, table_name)
+            row = _decode(model.__table__, row)
+            old_id = row.pop("id")
+            row["project_id"] = self.project_id
+            self.ids[table_name][old_id] = self._insert(model, row)
+        elif table_name == "tags":
+            self.pending_tags[row["id"]] = row["value"]
+        elif table_name == "issues":
+            row = _decode(db.issues.__table__, row)
+            old_id = row.pop("id")
+            row["project_id"] = self.project_id
+            row["column_id"] = self._remap("columns", row.get("column_id"))
+            row["swimlane_id"] = self._remap("swimlanes", row.get("swimlane_id"))
+            self.ids["issues"][old_id] = self._insert(db.issues, row)
+        elif table_name == "issues_tags":
+            if self.pending_tags:
+                self._resolve_tags()
+            self._queue(
+                "issues_tags",
+                {
+                    "issue_id": self.ids["issues"][row["issue_id"]],
+                    "tag_id": self.ids["tags"][row["tag_id"]],
+                },
+            )
+        elif table_name == "comments":
+            user_id = self._user_id(row.get("username"))
+            row = _decode(db.comments.__table__, row)
+            row.pop("id")
+            row["issue_id"] = self.ids["issues"][row["issue_id"]]
+            row["user_id"] = user_id
+            self._queue("comments", row)
+        elif table_name == "events":
+            row = _decode(db.events.__table__, row)
+            row.pop("id")
+            row["project_id"] = self.project_id
+            row["issue_id"] = self._remap("issues", row.get("issue_id"))
+            self._queue("events", row)
+        else:
+            raise ValueError(f"unknown table {table_name!r}")
+
+    def _queue(self, table_name: str, row: dict):
+        batch = self.batches[table_name]
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            self._write(table_name)
+
+    def _write(self, table_name: str):
+        rows = self.batches[table_name]
+        if rows:
+            self.session.exec(sqlmodel.insert(getattr(db, table_name)), params=rows)
+            self.batches[table_name] = []
+
+    def flush(self):
+        for table_name in self.batches:
+            self._write(table_name)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["export"] and len(sys.argv) == 3 and sys.argv[2].isdigit():
+        for chunk in gzipped(Transfer().export_project(int(sys.argv[2]))):
+            sys.stdout.buffer.write(chunk)
+    elif sys.argv[1:2] == ["import"] and len(sys.argv) in (3, 4):
+        with open(sys.argv[2], "rb") as fileobj:
+            name = sys.argv[3] if len(sys.argv) == 4 else None
+            project = Transfer().import_project(read_lines(fileobj), name)
+        print(f"imported project {project.id} ({project.name})")
+    else:
+        sys.exit(
+            "usage: python -m core.transfer export PROJECT_ID > FILE\n"
+            "       python -m core.transfer import FILE [NAME]"
+        )
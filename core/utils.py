@@ -1,5 +1,7 @@
 import hashlib
 
 
-def hash(body: str) -> str:
-    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+def hash(body: str | bytes) -> str:
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.sha256(body).hexdigest()
@@ -1,8 +1,18 @@
 import os
 import time
+from typing import Annotated
 
-from sqlalchemy import Column, Integer, Text
-from sqlmodel import Field, SQLModel, UniqueConstraint, create_engine
+from fastapi import Depends
+from sqlalchemy import Column, Integer, LargeBinary, Text, event
+from sqlalchemy.engine import make_url
+from sqlmodel import (
+    Field,
+    Index,
+    Session,
+    SQLModel,
+    UniqueConstraint,
+    create_engine,
+)
 
 
 def unix():
@@ -24,6 +34,9 @@ class projects(SQLModel, table=True):
     name: str = Field(index=True)
     checksum: str
     active: bool = Field(default=True)
+    # Counts the project's changes; keys its cache entries and ETags, which
+    # must change even when two changes land within the same second.
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
 
 class subissues(SQLModel, table=True):
@@ -74,6 +87,13 @@ class issues(SQLModel, table=True):
     column_id: int | None = Field(default=None, foreign_key="columns.id")
     swimlane_id: int | None = Field(default=None, foreign_key="swimlanes.id")
 
+    __table_args__ = (
+        Index("ix_issues_column_active_position", "column_id", "active", "position"),
+        Index("ix_issues_project_active_ctime", "project_id", "active", "ctime"),
+        Index("ix_issues_active_ctime", "active", "ctime"),
+        Index("ix_issues_project_status", "project_id", "status"),
+    )
+
 
 class columns(SQLModel, table=True):
     id: int = Field(primary_key=True)
@@ -92,7 +112,10 @@ class columns(SQLModel, table=True):
     active: bool = Field(default=True)
     project_id: int | None = Field(foreign_key="projects.id")
 
-    __table_args__ = (UniqueConstraint("name", "project_id", name="uq_c_i_project"),)
+    __table_args__ = (
+        UniqueConstraint("name", "project_id", name="uq_c_i_project"),
+        Index("ix_columns_project_active_position", "project_id", "active", "position"),
+    )
 
 
 class swimlanes(SQLModel, table=True):
@@ -114,18 +137,28 @@ class comments(SQLModel, table=True):
     user_id: int = Field(foreign_key="users.id")
     comment: bytes | None = None
 
+    __table_args__ = (Index("ix_comments_issue_ctime", "issue_id", "ctime"),)
+
 
 class tags(SQLModel, table=True):
     id: int = Field(primary_key=True)
     value: str
     ctime: int
 
+    __table_args__ = (Index("uq_tags_value", "value", unique=True),)
+
 
 class issues_tags(SQLModel, table=True):
     id: int = Field(primary_key=True)
     issue_id: int = Field(foreign_key="issues.id")
     tag_id: int = Field(foreign_key="tags.id")
 
+    __table_args__ = (
+        Index("uq_issues_tags_issue_tag", "issue_id", "tag_id", unique=True),
+        # Covers tag -> issues lookups and per-tag counts without the table.
+        Index("ix_issues_tags_tag_issue", "tag_id", "issue_id"),
+    )
+
 
 class users(SQLModel, table=True):
     id: int = Field(primary_key=True)
@@ -142,10 +175,157 @@ class events(SQLModel, table=True):
     action_name: str
     log: bytes | None = None
 
+    __table_args__ = (
+        Index("ix_events_project_ctime", "project_id", "ctime"),
+        Index("ix_events_issue_ctime", "issue_id", "ctime"),
+    )
+
+
+class event_checkpoints(SQLModel, table=True):
+    issue_id: int = Field(primary_key=True, foreign_key="issues.id")
+    project_id: int | None = Field(default=None, foreign_key="projects.id")
+    ctime: int
+    active_start: int | None = None
+    cursor: int
+    last_stop: int | None = None
+    events: int = Field(default=0)
+    last_event_id: int = Field(default=0)
+
+    __table_args__ = (Index("ix_event_checkpoints_project", "project_id"),)
+
+
+class event_segments(SQLModel, table=True):
+    id: int = Field(primary_key=True)
+    issue_id: int = Field(foreign_key="issues.id")
+    project_id: int | None = Field(default=None, foreign_key="projects.id")
+    stime: int
+    etime: int
+    status: int
+
+    __table_args__ = (
+        Index("ix_event_segments_issue_stime", "issue_id", "stime"),
+        Index("ix_event_segments_project_etime", "project_id", "etime"),
+    )
+
+
+class events_archive(SQLModel, table=True):
+    id: int = Field(primary_key=True)
+    project_id: int | None = Field(default=None, foreign_key="projects.id")
+    issue_id: int | None = Field(default=None, foreign_key="issues.id")
+    first_ctime: int
+    last_ctime: int
+    count: int
+    data: bytes = Field(sa_column=Column(LargeBinary(2**24 - 1), nullable=False))
+
+    __table_args__ = (
+        Index("ix_events_archive_issue", "issue_id"),
+        Index("ix_events_archive_project_ctime", "project_id", "last_ctime"),
+    )
+
+
+class search_documents(SQLModel, table=True):
+    id: int = Field(primary_key=True)
+    kind: str = Field(max_length=16)
+    source_id: int
+    issue_id: int = Field(foreign_key="issues.id", index=True)
+    project_id: int | None = Field(default=None, foreign_key="projects.id")
+    mtime: int
+    body: str = Field(sa_column=Column(Text))
+
+    __table_args__ = (
+        Index("uq_search_documents_source", "kind", "source_id", unique=True),
+    )
+
+
+class search_terms(SQLModel, table=True):
+    term: str = Field(primary_key=True, max_length=64)
+    document_id: int = Field(primary_key=True, foreign_key="search_documents.id")
+    count: int
+
+    __table_args__ = (Index("ix_search_terms_document", "document_id"),)
+
+
+class time_rollups(SQLModel, table=True):
+    id: int = Field(primary_key=True)
+    issue_id: int = Field(foreign_key="issues.id")
+    project_id: int | None = Field(default=None, foreign_key="projects.id")
+    day: int
+    tracked_seconds: int = Field(default=0)
+    logged_seconds: int = Field(default=0)
+
+    __table_args__ = (
+        Index("uq_time_rollups_issue_day", "issue_id", "day", unique=True),
+        Index("ix_time_rollups_project_day", "project_id", "day"),
+    )
+
 
 class version(SQLModel, table=True):
     version: int = Field(primary_key=True)
 
 
-engine = create_engine(os.getenv("DATABASE_URL", "sqlite:///database.db"))
-SQLModel.metadata.create_all(engine)
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _create_engine(url: str):
+    backend = make_url(url).get_backend_name()
+    options = {
+        "pool_pre_ping": _env_bool("DATABASE_POOL_PRE_PING", True),
+        "pool_recycle": _env_int("DATABASE_POOL_RECYCLE", 1800),
+        "query_cache_size": _env_int("DATABASE_STATEMENT_CACHE_SIZE", 500),
+    }
+    if backend == "sqlite":
+        busy_timeout = _env_int("DATABASE_BUSY_TIMEOUT", 5000)
+        options["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": busy_timeout / 1000,
+        }
+    else:
+        options["pool_size"] = _env_int("DATABASE_POOL_SIZE", 10)
+        options["max_overflow"] = _env_int("DATABASE_MAX_OVERFLOW", 20)
+        options["pool_timeout"] = _env_int("DATABASE_POOL_TIMEOUT", 30)
+
+    new_engine = create_engine(url, **options)
+
+    if backend == "sqlite":
+
+        @event.listens_for(new_engine, "connect")
+        def _sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+            cursor.close()
+
+    return new_engine
+
+
+def pool_status() -> dict:
+    pool = engine.pool
+    status = {"pool": type(pool).__name__, "status": pool.status()}
+    for key in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, key, None)
+        if callable(method):
+            status[key] = method()
+    return status
+
+
+engine = _create_engine(os.getenv("DATABASE_URL", "sqlite:///database.db"))
+
+
+def get_session():
+    with Session(engine, expire_on_commit=False) as session:
+        yield session
+        session.commit()
+
+
+# The request's session, committed once the endpoint returns.
+SessionDep = Annotated[Session, Depends(get_session, scope="function")]
@@ -1,244 +1,171 @@
+import contextlib
+import email.utils
+import os
 import time
-from datetime import datetime, timezone
-from enum import IntEnum
+from typing import Annotated, Literal
+
+import anyio.to_thread
+from fastapi import (
+    Depends,
+    FastAPI,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import (
+    HTMLResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+
+import api
+import db
+from core import (
+    assets,
+    boards,
+    columns,
+    comments,
+    etags,
+    events,
+    hub,
+    issues,
+    projects,
+    rollups,
+    search,
+    tags,
+    templating,
+    timeline,
+    transfer,
+)
+from core.issues import Status
+from db import SessionDep
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Handlers are plain functions that FastAPI dispatches to anyio's worker
+    # threads, so blocking database calls never stall the event loop.
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("THREADPOOL_SIZE", limiter.total_tokens))
+    hub.broker.start()
+    yield
+    hub.broker.stop()
+    events.sink.flush()
+    db.engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(api.router)
+
+app.mount(assets.STATIC_URL, assets.AssetFiles(directory="static"), name="static")
+
+templates = templating.create_templates("templates")
+
+
+def stream_template(
+    request: Request, name: str, context: dict, headers: dict | None = None
+):
+    """Send ``name`` as it renders instead of after.
+
+    Anything the context reads lazily must not need the request's session,
+    which is closed by the time the body is rendered.
+    """
+    template = templates.get_template(name)
+    return StreamingResponse(
+        templating.generate(template, {"request": request, **context}),
+        media_type="text/html",
+        headers=headers,
+    )
 
-from fastapi import FastAPI, Form, HTTPException, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 
-from core import columns, comments, events, issues, projects, tags
+def get_board_service(session: SessionDep):
+    return boards.Board(session)
 
-app = FastAPI()
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+def get_project_service(session: SessionDep):
+    return projects.Project(session)
 
-templates = Jinja2Templates(directory="templates")
 
+def get_column_service(session: SessionDep):
+    return columns.Column(session)
 
-def format_timestamp_utc(timestamp):
-    if timestamp is None or timestamp <= 0:
-        return ""
-    try:
-        dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-        return dt.strftime("%Y-%m-%d %H:%M:%S UTC")
-    except (ValueError, TypeError, OSError):
-        return str(timestamp)
 
+def get_issue_service(session: SessionDep):
+    return issues.Issue(session)
 
-class Status(IntEnum):
-    PENDING = 0
-    ACTIVE = 1
-    REVIEWING = 2
-    CLOSED = 3
 
+def get_comment_service(session: SessionDep):
+    return comments.Comment(session)
 
-def format_status(status):
-    return Status(status).name
 
+def get_tag_service(session: SessionDep):
+    return tags.Tag(session)
+
+
+def get_search_service(session: SessionDep):
+    return search.Search(session)
+
+
+def get_rollup_service(session: SessionDep):
+    return rollups.Rollup(session)
 
-def format_duration(seconds):
-    if seconds is None:
-        return ""
-    try:
-        total = max(0, int(seconds))
-    except (TypeError, ValueError):
-        return str(seconds)
-    hours = total // 3600
-    minutes = (total % 3600) // 60
-    secs = total % 60
-    if hours:
-        return f"{hours}h {minutes}m {secs}s"
-    if minutes:
-        return f"{minutes}m {secs}s"
-    return f"{secs}s"
-
-
-templates.env.filters["utc"] = format_timestamp_utc
-templates.env.filters["status"] = format_status
-templates.env.filters["duration"] = format_duration
-
-project_service = projects.Project()
-column_service = columns.Column()
-issue_service = issues.Issue()
-comment_service = comments.Comment()
-event_service = events.Event()
-tag_service = tags.Tag()
-
-
-def build_gantt_data(project_id: int, cols):
-    events_list = event_service.get_by_project(project_id)
-    events_by_issue = {}
-    for event in events_list:
-        if event.issue_id is None:
-            continue
-        events_by_issue.setdefault(int(event.issue_id), []).append(event)
-
-    now = int(time.time())
-    rows = []
-    min_ts = None
-    max_ts = None
-
-    for col in cols:
-        issues_list = issue_service.get_issues_by_column(col.id)
-        for issue in issues_list:
-            segments = []
-            ctime = issue.ctime or now
-            stime = issue.stime or 0
-            etime = issue.etime or 0
-            mtime = issue.mtime or ctime
-            issue_events = events_by_issue.get(int(issue.id), [])
-            issue_events.sort(key=lambda e: e.ctime)
-
-            if issue_events:
-                active_start = None
-                cursor = ctime
-                last_stop = None
-                for event in issue_events:
-                    if event.action_name == "start":
-                        if active_start is None:
-                            if event.ctime > cursor:
-                                status = (
-                                    int(Status.PENDING)
-                                    if last_stop is None
-                                    else int(Status.CLOSED)
-                                )
-                                segments.append(
-                                    {
-                                        "start": cursor,
-                                        "end": event.ctime,
-                                        "status": status,
-                                    }
-                                )
-                            active_start = event.ctime
-                    elif event.action_name == "stop":
-                        if active_start is not None:
-                            segments.append(
-                                {
-                                    "start": active_start,
-                                    "end": event.ctime,
-                                    "status": int(Status.ACTIVE),
-                                }
-                            )
-                            active_start = None
-                            cursor = event.ctime
-                            last_stop = event.ctime
-                        else:
-                            cursor = event.ctime
-                            last_stop = event.ctime
-                if active_start is not None:
-                    active_end = now if issue.status == int(Status.ACTIVE) else mtime
-                    segments.append(
-                        {
-                            "start": active_start,
-                            "end": active_end,
-                            "status": int(Status.ACTIVE),
-                        }
-                    )
-                else:
-                    tail_end = mtime if mtime else now
-                    if tail_end > cursor:
-                        status = (
-                            int(Status.CLOSED)
-                            if last_stop is not None
-                            else int(Status.PENDING)
-                        )
-                        segments.append(
-                            {"start": cursor, "end": tail_end, "status": status}
-                        )
-            else:
-                if stime and stime > ctime:
-                    segments.append(
-                        {"start": ctime, "end": stime, "status": int(Status.PENDING)}
-                    )
-                if stime:
-                    active_end = (
-                        etime
-                        if etime
-                        else (now if issue.status == int(Status.ACTIVE) else mtime)
-                    )
-                    if active_end < stime:
-                        active_end = stime
-                    segments.append(
-                        {
-                            "start": stime,
-                            "end": active_end,
-                            "status": int(Status.ACTIVE),
-                        }
-                    )
-                else:
-                    pending_end = mtime if mtime > ctime else ctime
-                    segments.append(
-                        {
-                            "start": ctime,
-                            "end": pending_end,
-                            "status": int(Status.PENDING),
-                        }
-                    )
-                if etime:
-                    closed_end = mtime if mtime and mtime >= etime else etime
-                    segments.append(
-                        {
-                            "start": etime,
-                            "end": closed_end,
-                            "status": int(Status.CLOSED),
-                        }
-                    )
-
-            for seg in segments:
-                if seg["end"] < seg["start"]:
-                    seg["end"] = seg["start"]
-                min_ts = seg["start"] if min_ts is None else min(min_ts, seg["start"])
-                max_ts = seg["end"] if max_ts is None else max(max_ts, seg["end"])
-
-            rows.append(
-                {
-                    "issue": issue,
-                    "column_name": col.name,
-                    "segments": segments,
-                }
-            )
 
-    duration = max(0, (max_ts or 0) - (min_ts or 0))
-    for row in rows:
-        for seg in row["segments"]:
-            if duration == 0:
-                left_pct = 0
-                width_pct = 100
-            else:
-                left_pct = (seg["start"] - min_ts) / duration * 100
-                width_pct = (seg["end"] - seg["start"]) / duration * 100
-                width_pct = max(1.0, width_pct)
-            seg["left_pct"] = min(100, max(0, left_pct))
-            seg["width_pct"] = min(100, max(1.0, width_pct))
-
-    ticks = []
-    now_pct = None
-    if min_ts is not None and max_ts is not None and duration > 0:
-        for i in range(6):
-            pct = i * 20
-            ts = int(min_ts + (duration * (i / 5)))
-            ticks.append({"pct": pct, "ts": ts})
-        now_pct = (now - min_ts) / duration * 100
-        now_pct = min(100, max(0, now_pct))
+def get_etag_service(session: SessionDep):
+    return etags.ETag(session)
 
+
+BoardService = Annotated[boards.Board, Depends(get_board_service)]
+ProjectService = Annotated[projects.Project, Depends(get_project_service)]
+ColumnService = Annotated[columns.Column, Depends(get_column_service)]
+IssueService = Annotated[issues.Issue, Depends(get_issue_service)]
+CommentService = Annotated[comments.Comment, Depends(get_comment_service)]
+TagService = Annotated[tags.Tag, Depends(get_tag_service)]
+SearchService = Annotated[search.Search, Depends(get_search_service)]
+RollupService = Annotated[rollups.Rollup, Depends(get_rollup_service)]
+ETagService = Annotated[etags.ETag, Depends(get_etag_service)]
+
+
+def validator_headers(validator: tuple[str, int]) -> dict[str, str]:
+    etag, last_modified = validator
     return {
-        "rows": rows,
-        "min_ts": min_ts,
-        "max_ts": max_ts,
-        "ticks": ticks,
-        "now_pct": now_pct,
-        "status_labels": [
-            (int(Status.PENDING), "PENDING"),
-            (int(Status.ACTIVE), "ACTIVE"),
-            (int(Status.REVIEWING), "REVIEWING"),
-            (int(Status.CLOSED), "CLOSED"),
-        ],
+        "ETag": etag,
+        "Last-Modified": email.utils.formatdate(last_modified, usegmt=True),
+        # Let browsers keep the page but check back on every view.
+        "Cache-Control": "no-cache",
     }
 
 
+def not_modified(request: Request, validator: tuple[str, int]) -> Response | None:
+    """Return a 304 if the client's copy still matches ``validator``."""
+    etag, last_modified = validator
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        fresh = "*" in tags or etag in tags
+    else:
+        try:
+            since = email.utils.parsedate_to_datetime(
+                request.headers.get("if-modified-since", "")
+            )
+            fresh = since.timestamp() >= last_modified
+        except (TypeError, ValueError):
+            fresh = False
+    if fresh:
+        return Response(status_code=304, headers=validator_headers(validator))
+    return None
+
+
+@app.get("/metrics/pool")
+async def pool_metrics():
+    return db.pool_status()
+
+
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request):
+def index(request: Request, project_service: ProjectService):
     projects_list = project_service.get_projects(10, 0)
     return templates.TemplateResponse(
         "projects.html",
@@ -247,81 +174,262 @@ async def index(request: Request):
 
 
 @app.get("/project/{project_id}", response_class=HTMLResponse)
-async def board(request: Request, project_id: int):
-    project = project_service.get_project(project_id)
-    if not project:
+def board(
+    request: Request,
+    project_id: int,
+    board_service: BoardService,
+    etag_service: ETagService,
+):
+    validator = etag_service.for_project(project_id, "board", with_events=True)
+    if validator is None:
         raise HTTPException(status_code=404, detail="Project not found")
+    cached = not_modified(request, validator)
+    if cached is not None:
+        return cached
 
-    cols = column_service.get_columns_by_project(project_id)
+    loaded = board_service.get_board(project_id, with_events=False)
+    if not loaded:
+        raise HTTPException(status_code=404, detail="Project not found")
 
-    board_data = []
-    for col in cols:
-        issues_list = issue_service.get_issues_by_column(col.id)
-        board_data.append({"column": col, "issues": issues_list})
+    def load_gantt():
+        # Called once the columns are out, so the events are read and laid
+        # out while the browser is already drawing the page.
+        event_service = events.Event()
+        return timeline.build(
+            loaded["board_data"],
+            event_service.get_by_project(project_id),
+            history=event_service.get_history(project_id),
+        )
 
-    gantt_data = build_gantt_data(project_id, cols)
-    return templates.TemplateResponse(
+    return stream_template(
+        request,
         "board.html",
         {
-            "request": request,
-            "project": project,
-            "board_data": board_data,
+            "project": loaded["project"],
+            "board_data": loaded["board_data"],
+            "load_gantt": load_gantt,
             "active_page": "projects",
             "active_subpage": "board",
-            **gantt_data,
         },
+        headers=validator_headers(validator),
     )
 
 
-@app.get("/project/{project_id}/kanban", response_class=HTMLResponse)
-async def kanban(request: Request, project_id: int):
-    project = project_service.get_project(project_id)
-    if not project:
+@app.get(
+    "/project/{project_id}/fragments/column/{column_id}",
+    response_class=HTMLResponse,
+)
+def column_fragment(
+    request: Request,
+    project_id: int,
+    column_id: int,
+    project_service: ProjectService,
+    column_service: ColumnService,
+    issue_service: IssueService,
+    etag_service: ETagService,
+):
+    validator = etag_service.for_project(project_id, f"column-{column_id}")
+    if validator is None:
         raise HTTPException(status_code=404, detail="Project not found")
+    cached = not_modified(request, validator)
+    if cached is not None:
+        return cached
+
+    column = column_service.get_column(column_id)
+    if column is None or column.project_id != project_id or not column.active:
+        raise HTTPException(status_code=404, detail="Column not found")
+    return templates.TemplateResponse(
+        "partials/column.html",
+        {
+            "request": request,
+            "project": project_service.get_project(project_id),
+            "item": {
+                "column": column,
+                "issues": issue_service.get_issues_by_column(column_id),
+            },
+        },
+        headers=validator_headers(validator),
+    )
 
-    cols = column_service.get_columns_by_project(project_id)
 
-    board_data = []
-    for col in cols:
-        issues_list = issue_service.get_issues_by_column(col.id)
-        board_data.append({"column": col, "issues": issues_list})
+@app.get("/project/{project_id}/fragments/gantt", response_class=HTMLResponse)
+def gantt_fragment(
+    request: Request,
+    project_id: int,
+    board_service: BoardService,
+    etag_service: ETagService,
+):
+    validator = etag_service.for_project(project_id, "board-gantt", with_events=True)
+    if validator is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    cached = not_modified(request, validator)
+    if cached is not None:
+        return cached
 
+    loaded = board_service.get_board(project_id)
+    if not loaded:
+        raise HTTPException(status_code=404, detail="Project not found")
+    gantt_data = timeline.build(
+        loaded["board_data"], loaded["events"], history=loaded["history"]
+    )
     return templates.TemplateResponse(
+        "partials/board_gantt.html",
+        {"request": request, "gantt": gantt_data},
+        headers=validator_headers(validator),
+    )
+
+
+@app.get("/project/{project_id}/stream")
+async def project_stream(request: Request, project_id: int):
+    """Server-sent events carrying the project's changes as they commit."""
+    mtime = await anyio.to_thread.run_sync(projects.Project().get_mtime, project_id)
+    if mtime is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    subscription, missed = hub.hub.subscribe(
+        project_id, request.headers.get("last-event-id")
+    )
+    return StreamingResponse(
+        hub.hub.stream(subscription, missed, request.is_disconnected),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/project/{project_id}/kanban", response_class=HTMLResponse)
+def kanban(
+    request: Request,
+    project_id: int,
+    project_service: ProjectService,
+    etag_service: ETagService,
+):
+    validator = etag_service.for_project(project_id, "kanban")
+    if validator is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    cached = not_modified(request, validator)
+    if cached is not None:
+        return cached
+
+    project = project_service.get_project(project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return stream_template(
+        request,
         "kanban.html",
         {
-            "request": request,
             "project": project,
-            "board_data": board_data,
+            "board_data": boards.Board().iter_board(project_id),
             "active_page": "projects",
             "active_subpage": "kanban",
         },
+        headers=validator_headers(validator),
     )
 
 
+GANTT_ZOOMS = [1, 7, 14, 90]
+
+
 @app.get("/project/{project_id}/gantt", response_class=HTMLResponse)
-async def gantt(request: Request, project_id: int):
-    project = project_service.get_project(project_id)
-    if not project:
+def gantt(
+    request: Request,
+    project_id: int,
+    board_service: BoardService,
+    etag_service: ETagService,
+    since: int | None = None,
+    until: int | None = None,
+    days: int | None = None,
+    width: int = timeline.WIDTH,
+    rows: int = timeline.MAX_ROWS,
+):
+    if days is not None and days > 0 and since is None:
+        since = int((until or time.time()) - days * 86400)
+    if since is not None and until is not None and since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+
+    validator = etag_service.for_project(
+        project_id,
+        "gantt",
+        query=str(request.url.query),
+        with_events=True,
+        clock=days is not None,
+    )
+    if validator is None:
         raise HTTPException(status_code=404, detail="Project not found")
+    cached = not_modified(request, validator)
+    if cached is not None:
+        return cached
 
-    cols = column_service.get_columns_by_project(project_id)
-    gantt_data = build_gantt_data(project_id, cols)
+    loaded = board_service.get_board(project_id, since=since, until=until)
+    if not loaded:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    gantt_data = timeline.build(
+        loaded["board_data"],
+        loaded["events"],
+        since=since,
+        until=until,
+        width=max(1, width),
+        max_rows=max(1, rows),
+        history=loaded["history"],
+    )
 
     return templates.TemplateResponse(
         "gantt.html",
         {
             "request": request,
-            "project": project,
+            "project": loaded["project"],
             **gantt_data,
+            "zooms": GANTT_ZOOMS,
+            "days": days,
+            "windowed": since is not None or until is not None,
             "active_page": "projects",
             "active_subpage": "gantt",
         },
+        headers=validator_headers(validator),
     )
 
 
+@app.get("/project/{project_id}/time")
+def project_time(
+    project_id: int,
+    project_service: ProjectService,
+    rollup_service: RollupService,
+    since: int | None = None,
+    until: int | None = None,
+    days: int | None = None,
+):
+    if not project_service.get_project(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    if days is not None and days > 0 and since is None:
+        since = int((until or time.time()) - days * 86400)
+
+    return {
+        "project_id": project_id,
+        "since": since,
+        "until": until,
+        "days": [
+            {"day": day, "tracked": tracked, "logged": logged}
+            for day, tracked, logged in rollup_service.by_day(project_id, since, until)
+        ],
+        "issues": [
+            {
+                "issue_id": issue.id,
+                "title": issue.title,
+                "tracked": tracked,
+                "logged": logged,
+            }
+            for issue, tracked, logged in rollup_service.by_issue(
+                project_id, since, until
+            )
+        ],
+    }
+
+
 @app.post("/project/{project_id}/issue")
-async def create_issue(
+def create_issue(
     project_id: int,
+    issue_service: IssueService,
     title: str = Form(...),
     column_id: int = Form(...),
     description: str = Form(""),
@@ -331,34 +439,150 @@ async def create_issue(
 
 
 @app.post("/project/{project_id}/column")
-async def create_column(
-    project_id: int, name: str = Form(...), position: int = Form(0)
+def create_column(
+    project_id: int,
+    column_service: ColumnService,
+    name: str = Form(...),
+    position: int = Form(0),
 ):
     column_service.create(name, project_id, position)
     return RedirectResponse(url=f"/project/{project_id}", status_code=303)
 
 
 @app.get("/issues", response_class=HTMLResponse)
-async def issues(request: Request):
-    issues_list = issue_service.get_issues()
-    return templates.TemplateResponse(
+def list_issues(
+    request: Request,
+    before: str | None = None,
+    after: str | None = None,
+    limit: int = issues.PAGE_SIZE,
+    tag: Annotated[list[str] | None, Query()] = None,
+    match: Literal["all", "any"] = "all",
+):
+    try:
+        before_key = issues.decode_cursor(before) if before else None
+        after_key = issues.decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    tag = tags.normalize(tag or [])
+    page = issues.Issue().stream_issues_page(
+        limit=limit, before=before_key, after=after_key, tags=tag, match=match
+    )
+    filters = [("tag", value) for value in tag]
+    if len(tag) > 1 and match != "all":
+        filters.append(("match", match))
+    return stream_template(
+        request,
         "issues.html",
-        {"request": request, "issues": issues_list, "active_page": "issues"},
+        {
+            "active_page": "issues",
+            "tags": tag,
+            "match": match,
+            "filters": filters,
+            **page,
+        },
+    )
+
+
+@app.post("/issues/tags")
+def bulk_tag_issues(
+    tag_service: TagService,
+    issue_id: Annotated[list[int] | None, Form()] = None,
+    tag: str = Form(""),
+    action: Literal["add", "remove"] = Form("add"),
+):
+    # Comma separated, so one form can apply several tags at once.
+    values = tags.normalize(tag.split(","))
+    if not issue_id or not values:
+        raise HTTPException(status_code=400, detail="No issues or tags given")
+    if action == "add":
+        tag_service.tag_issues(issue_id, values)
+    else:
+        tag_service.untag_issues(issue_id, values)
+    return RedirectResponse(url="/issues", status_code=303)
+
+
+@app.get("/search", response_class=HTMLResponse)
+def search_issues(
+    request: Request,
+    search_service: SearchService,
+    q: str = "",
+    project_id: str = "",
+    status: str = "",
+    tag: str = "",
+    limit: int = search.PAGE_SIZE,
+    offset: int = 0,
+):
+    # The form sends blank fields for "any", so these arrive as text.
+    try:
+        project_id = int(project_id) if project_id.strip() else None
+        status = int(status) if status.strip() else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid project or status")
+    page = search_service.search(
+        q,
+        project_id=project_id,
+        status=status,
+        tag=tag or None,
+        limit=limit,
+        offset=offset,
+    )
+    filters = {
+        "q": q,
+        "project_id": project_id,
+        "status": status,
+        "tag": tag,
+        "limit": page["limit"],
+    }
+    return templates.TemplateResponse(
+        "search.html",
+        {
+            "request": request,
+            "active_page": "issues",
+            "statuses": list(Status),
+            "filters": {k: v for k, v in filters.items() if v not in (None, "")},
+            **filters,
+            **page,
+        },
     )
 
 
 @app.post("/issue/{issue_id}/move")
-async def move_issue(
-    issue_id: int, column_id: int = Form(...), position: int = Form(...)
+def move_issue(
+    issue_id: int,
+    issue_service: IssueService,
+    column_id: int = Form(...),
+    position: int | None = Form(None),
+    after_id: int | None = Form(None),
+    before_id: int | None = Form(None),
 ):
-    issue = issue_service.move(issue_id, column_id, position)
+    issue = issue_service.move(
+        issue_id, column_id, position, after_id=after_id, before_id=before_id
+    )
     if issue:
         return RedirectResponse(url=f"/project/{issue.project_id}", status_code=303)
     raise HTTPException(status_code=404)
 
 
 @app.get("/issue/{issue_id}", response_class=HTMLResponse)
-async def view_issue(request: Request, issue_id: int, edit: int = 0):
+def view_issue(
+    request: Request,
+    issue_id: int,
+    project_service: ProjectService,
+    column_service: ColumnService,
+    issue_service: IssueService,
+    comment_service: CommentService,
+    tag_service: TagService,
+    etag_service: ETagService,
+    edit: int = 0,
+):
+    validator = etag_service.for_issue(issue_id, "issue", str(request.url.query))
+    if validator is None:
+        raise HTTPException(status_code=404, detail="Issue not found")
+    cached = not_modified(request, validator)
+    if cached is not None:
+        return cached
+
     issue = issue_service.get_issue(issue_id)
     if not issue:
         raise HTTPException(status_code=404, detail="Issue not found")
@@ -382,11 +606,49 @@ async def view_issue(request: Request, issue_id: int, edit: int = 0):
             "comments": issue_comments,
             "tags": tags,
         },
+        headers=validator_headers(validator),
+    )
+
+
+@app.get("/issue/{issue_id}/fragments/card", response_class=HTMLResponse)
+def card_fragment(
+    request: Request,
+    issue_id: int,
+    issue_service: IssueService,
+    etag_service: ETagService,
+):
+    validator = etag_service.for_issue(issue_id, "card")
+    if validator is None:
+        raise HTTPException(status_code=404, detail="Issue not found")
+    cached = not_modified(request, validator)
+    if cached is not None:
+        return cached
+
+    issue = issue_service.get_issue(issue_id)
+    if not issue:
+        raise HTTPException(status_code=404, detail="Issue not found")
+    return templates.TemplateResponse(
+        "partials/card.html",
+        {"request": request, "issue": issue},
+        headers=validator_headers(validator),
     )
 
 
 @app.get("/issue/{issue_id}/edit", response_class=HTMLResponse)
-async def view_issue_edit(request: Request, issue_id: int):
+def view_issue_edit(
+    request: Request,
+    issue_id: int,
+    project_service: ProjectService,
+    issue_service: IssueService,
+    etag_service: ETagService,
+):
+    validator = etag_service.for_issue(issue_id, "issue-edit")
+    if validator is None:
+        raise HTTPException(status_code=404, detail="Issue not found")
+    cached = not_modified(request, validator)
+    if cached is not None:
+        return cached
+
     issue = issue_service.get_issue(issue_id)
     if not issue:
         raise HTTPException(status_code=404, detail="Issue not found")
@@ -402,12 +664,14 @@ async def view_issue_edit(request: Request, issue_id: int):
             "issue": issue,
             "project": project,
         },
+        headers=validator_headers(validator),
     )
 
 
 @app.post("/issue/{issue_id}")
-async def update_issue(
+def update_issue(
     issue_id: int,
+    issue_service: IssueService,
     title: str = Form(default=None),
     description: str = Form(default=None),
     status: int = Form(default=None),
@@ -436,7 +700,7 @@ async def update_issue(
 
 
 @app.post("/issue/{issue_id}/start")
-async def start_issue(issue_id: int):
+def start_issue(issue_id: int, issue_service: IssueService):
     issue = issue_service.get_issue(issue_id)
     if not issue:
         raise HTTPException(status_code=404, detail="Issue not found")
@@ -447,7 +711,7 @@ async def start_issue(issue_id: int):
 
 
 @app.post("/issue/{issue_id}/stop")
-async def stop_issue(issue_id: int):
+def stop_issue(issue_id: int, issue_service: IssueService):
     issue = issue_service.get_issue(issue_id)
     if not issue:
         raise HTTPException(status_code=404, detail="Issue not found")
@@ -458,7 +722,11 @@ async def stop_issue(issue_id: int):
 
 
 @app.post("/issue/{issue_id}/log")
-async def log_issue_time(issue_id: int, minutes: int = Form(0)):
+def log_issue_time(
+    issue_id: int,
+    issue_service: IssueService,
+    minutes: int = Form(0),
+):
     issue = issue_service.get_issue(issue_id)
     if not issue:
         raise HTTPException(status_code=404, detail="Issue not found")
@@ -470,7 +738,11 @@ async def log_issue_time(issue_id: int, minutes: int = Form(0)):
 
 
 @app.post("/issue/{issue_id}/description")
-def update_issue_description(issue_id: int, description: str = Form("")):
+def update_issue_description(
+    issue_id: int,
+    issue_service: IssueService,
+    description: str = Form(""),
+):
     issue = issue_service.update(issue_id, **{"description": description})
     if issue:
         return RedirectResponse(
@@ -480,7 +752,12 @@ def update_issue_description(issue_id: int, description: str = Form("")):
 
 
 @app.post("/issue/{issue_id}/comment")
-async def create_comment(issue_id: int, comment: str = Form("")):
+def create_comment(
+    issue_id: int,
+    issue_service: IssueService,
+    comment_service: CommentService,
+    comment: str = Form(""),
+):
     issue = issue_service.get_issue(issue_id)
     if not issue:
         raise HTTPException(status_code=404, detail="Issue not found")
@@ -493,24 +770,70 @@ async def create_comment(issue_id: int, comment: str = Form("")):
 
 
 @app.post("/project")
-async def create_project(name: str = Form(...)):
+def create_project(project_service: ProjectService, name: str = Form(...)):
     project = project_service.create(name)
     return RedirectResponse(url=f"/project/{project.id}", status_code=303)
 
 
+@app.get("/project/{project_id}/export")
+def export_project(
+    project_id: int, project_service: ProjectService, compress: bool = True
+):
+    if project_service.get_mtime(project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    # The stream outlives the request session, so it reads through its own.
+    lines = transfer.Transfer().export_project(project_id)
+    filename = f"project-{project_id}.ndjson"
+    if compress:
+        lines = transfer.gzipped(lines)
+        filename += ".gz"
+    return StreamingResponse(
+        lines,
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post("/project/import")
+def import_project(
+    session: SessionDep,
+    file: Annotated[UploadFile, File()],
+    name: Annotated[str, Form()] = "",
+):
+    try:
+        project = transfer.Transfer(session).import_project(
+            transfer.read_lines(file.file), name.strip() or None
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=f"Invalid export: {error}")
+    return RedirectResponse(url=f"/project/{project.id}", status_code=303)
+
+
 @app.post("/issue/{issue_id}/tag")
-async def create_tag(issue_id: int, tag: str = Form("")):
+def create_tag(issue_id: int, tag_service: TagService, tag: str = Form("")):
     tag = tag_service.tag_issue(issue_id, tag)
     if tag:
         return RedirectResponse(url=f"/issue/{issue_id}", status_code=303)
     raise HTTPException(status_code=404, detail="Tag not created")
 
 
+@app.post("/issue/{issue_id}/untag")
+def remove_tag(issue_id: int, tag_service: TagService, tag: str = Form("")):
+    if tag_service.untag_issue(issue_id, tag):
+        return RedirectResponse(url=f"/issue/{issue_id}", status_code=303)
+    raise HTTPException(status_code=404, detail="Tag not found")
+
+
 if __name__ == "__main__":
     import uvicorn
 
+    import migrations
+
+    migrations.run(db.engine)
     uvicorn.run(
         app,
         host="0.0.0.0",
         port=8000,
+        # Event streams never finish on their own; cut them off on shutdown.
+        timeout_graceful_shutdown=5,
     )
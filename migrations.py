@@ -0,0 +1,226 @@
+"""Ordered schema migrations, recorded in the ``version`` table.
+
+Run once per deploy, before starting the app servers:
+
+    python migrations.py           apply pending migrations
+    python migrations.py status    list applied and pending versions
+
+Every step must be idempotent: it may be re-run against a schema that was
+already created by ``create_all`` or partially migrated by hand.
+"""
+
+import contextlib
+import sys
+import time
+
+import sqlalchemy
+import sqlmodel
+from sqlalchemy.schema import CreateIndex
+
+import db
+from core import rollups, search
+
+LOCK_NAME = "cado_migrations"
+LOCK_TIMEOUT = 60
+
+
+def create_index(connection, index):
+    """Create ``index``, without blocking writes where the backend allows it."""
+    ddl = str(CreateIndex(index).compile(dialect=connection.dialect))
+    if connection.dialect.name == "mysql":
+        ddl += " ALGORITHM=INPLACE LOCK=NONE"
+    connection.exec_driver_sql(ddl)
+
+
+def drop_index(connection, table_name: str, index_name: str):
+    if connection.dialect.name == "mysql":
+        connection.exec_driver_sql(f"DROP INDEX {index_name} ON {table_name}")
+    else:
+        connection.exec_driver_sql(f"DROP INDEX {index_name}")
+
+
+def _sync_indexes(connection):
+    """Create any index declared on the models that the live schema lacks."""
+    inspector = sqlalchemy.inspect(connection)
+    for table in db.SQLModel.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                create_index(connection, index)
+
+
+def _dedupe_tags(connection):
+    tags = db.tags.__table__
+    links = db.issues_tags.__table__
+
+    keep = {}
+    rows = connection.execute(
+        sqlalchemy.select(tags.c.id, tags.c.value).order_by(tags.c.id)
+    ).all()
+    for tag_id, value in rows:
+        if value not in keep:
+            keep[value] = tag_id
+            continue
+        connection.execute(
+            sqlalchemy.update(links)
+            .where(links.c.tag_id == tag_id)
+            .values(tag_id=keep[value])
+        )
+        connection.execute(sqlalchemy.delete(tags).where(tags.c.id == tag_id))
+
+    seen = set()
+    rows = connection.execute(
+        sqlalchemy.select(links.c.id, links.c.issue_id, links.c.tag_id).order_by(
+            links.c.id
+        )
+    ).all()
+    for link_id, issue_id, tag_id in rows:
+        if (issue_id, tag_id) in seen:
+            connection.execute(sqlalchemy.delete(links).where(links.c.id == link_id))
+        else:
+            seen.add((issue_id, tag_id))
+
+
+def _add_access_path_indexes(connection):
+    # The unique indexes on tags.value and issues_tags(issue_id, tag_id) would
+    # fail on databases that already hold duplicates, so merge those first.
+    _dedupe_tags(connection)
+    _sync_indexes(connection)
+
+
+def _add_issue_listing_indexes(connection):
+    # (project_id, active) is superseded by (project_id, active, ctime), which
+    # also serves the newest-first keyset scan of the issues listing.
+    inspector = sqlalchemy.inspect(connection)
+    existing = {index["name"] for index in inspector.get_indexes("issues")}
+    if "ix_issues_project_active" in existing:
+        drop_index(connection, "issues", "ix_issues_project_active")
+    _sync_indexes(connection)
+
+
+def _add_search_index(connection):
+    search.install(connection)
+    with sqlmodel.Session(bind=connection) as session:
+        search.Search(session).rebuild()
+
+
+def _backfill_time_rollups(connection):
+    with sqlmodel.Session(bind=connection) as session:
+        rollups.Rollup(session).rebuild()
+
+
+def _add_tag_count_index(connection):
+    # (tag_id) is superseded by (tag_id, issue_id), which answers tag filters
+    # and tag counts from the index alone.
+    inspector = sqlalchemy.inspect(connection)
+    existing = {index["name"] for index in inspector.get_indexes("issues_tags")}
+    if "ix_issues_tags_tag" in existing:
+        drop_index(connection, "issues_tags", "ix_issues_tags_tag")
+    _sync_indexes(connection)
+
+
+def _add_project_version(connection):
+    # Caches and ETags key on projects.version now; mtime goes back to being
+    # a plain timestamp, and mtimes pushed into the future by the old
+    # bump-by-one-second rule are pulled back to the present.
+    inspector = sqlalchemy.inspect(connection)
+    existing = {column["name"] for column in inspector.get_columns("projects")}
+    if "version" not in existing:
+        connection.exec_driver_sql(
+            "ALTER TABLE projects ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+        )
+    projects = db.projects.__table__
+    now = int(time.time())
+    connection.execute(
+        sqlalchemy.update(projects).where(projects.c.mtime > now).values(mtime=now)
+    )
+
+
+MIGRATIONS = [
+    (1, _add_access_path_indexes),
+    (2, _add_issue_listing_indexes),
+    (3, _add_search_index),
+    (4, _backfill_time_rollups),
+    # ix_issues_project_status, for the running-issue check behind ETags.
+    (5, _sync_indexes),
+    (6, _add_tag_count_index),
+    (7, _add_project_version),
+]
+
+
+@contextlib.contextmanager
+def _migration_lock(connection):
+    # Keeps two deploys from migrating the same MySQL database concurrently.
+    # SQLite serialises writers on its own.
+    if connection.dialect.name != "mysql":
+        yield
+        return
+    acquired = connection.exec_driver_sql(
+        f"SELECT GET_LOCK('{LOCK_NAME}', {LOCK_TIMEOUT})"
+    ).scalar()
+    connection.commit()
+    if not acquired:
+        raise RuntimeError(f"could not acquire migration lock {LOCK_NAME!r}")
+    try:
+        yield
+    finally:
+        connection.exec_driver_sql(f"SELECT RELEASE_LOCK('{LOCK_NAME}')")
+        connection.commit()
+
+
+def _applied_versions(connection) -> set[int]:
+    version = db.version.__table__
+    applied = set(connection.execute(sqlalchemy.select(version.c.version)).scalars())
+    connection.commit()
+    return applied
+
+
+def _check_order():
+    numbers = [number for number, _ in MIGRATIONS]
+    if numbers != sorted(set(numbers)):
+        raise RuntimeError("MIGRATIONS must be listed in strictly increasing order")
+
+
+def status(engine) -> tuple[list[int], list[int]]:
+    _check_order()
+    with engine.connect() as connection:
+        if not sqlalchemy.inspect(connection).has_table(db.version.__tablename__):
+            return [], [number for number, _ in MIGRATIONS]
+        applied = _applied_versions(connection)
+    return (
+        [number for number, _ in MIGRATIONS if number in applied],
+        [number for number, _ in MIGRATIONS if number not in applied],
+    )
+
+
+def run(engine) -> list[int]:
+    """Create missing tables, then apply pending migrations in order."""
+    _check_order()
+    version = db.version.__table__
+    migrated = []
+    with engine.connect() as connection, _migration_lock(connection):
+        db.SQLModel.metadata.create_all(connection)
+        connection.commit()
+        applied = _applied_versions(connection)
+        for number, step in MIGRATIONS:
+            if number in applied:
+                continue
+            # One transaction per step, so a failure leaves every earlier
+            # step recorded. MySQL commits DDL implicitly regardless.
+            with connection.begin():
+                step(connection)
+                connection.execute(sqlalchemy.insert(version).values(version=number))
+            migrated.append(number)
+    return migrated
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["status"]:
+        applied, pending = status(db.engine)
+        print(f"applied: {applied or 'none'}")
+        print(f"pending: {pending or 'none'}")
+    elif sys.argv[1:]:
+        sys.exit(f"usage: {sys.argv[0]} [status]")
+    else:
+        migrated = run(db.engine)
+        print(f"applied: {migrated}" if migrated else "schema is up to date")
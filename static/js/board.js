@@ -1,57 +1,262 @@
+// Captured now: currentScript is only set while the script first runs.
+const projectId = document.currentScript.dataset.projectId;
+
 document.addEventListener('DOMContentLoaded', function() {
-    const issueCards = document.querySelectorAll('.issue-card');
-    
-    issueCards.forEach(card => {
+    function makeDraggable(card) {
         card.draggable = true;
-        
+
         card.addEventListener('dragstart', function(e) {
             e.dataTransfer.setData('text/plain', this.dataset.issueId);
             this.style.opacity = '0.5';
         });
-        
+
         card.addEventListener('dragend', function() {
             this.style.opacity = '1';
         });
-    });
-    
-    const columnContainers = document.querySelectorAll('.column-container');
-    
-    columnContainers.forEach(container => {
-        const columnId = container.dataset.columnId;
-        
+    }
+
+    // Find the cards the dropped issue lands between, so the server can rank
+    // it relative to them instead of renumbering the column.
+    function dropNeighbours(container, y, issueId) {
+        const cards = Array.from(container.querySelectorAll('.issue-card'))
+            .filter(card => card.dataset.issueId !== issueId);
+        let after = null;
+        let before = null;
+        for (const card of cards) {
+            const box = card.getBoundingClientRect();
+            if (y < box.top + box.height / 2) {
+                before = card;
+                break;
+            }
+            after = card;
+        }
+        return { after, before };
+    }
+
+    function findCard(issueId) {
+        return document.querySelector(`.issue-card[data-issue-id="${issueId}"]`);
+    }
+
+    function findColumn(columnId) {
+        return document.querySelector(
+            `.column-container[data-column-id="${columnId}"]`);
+    }
+
+    // Anything unexpected: fall back to what the server renders.
+    function fail() {
+        window.location.reload();
+    }
+
+    function fetchFragment(url) {
+        return fetch(url).then(response => {
+            if (!response.ok) {
+                throw new Error(`${url}: ${response.status}`);
+            }
+            return response.text();
+        }).then(html => {
+            const template = document.createElement('template');
+            template.innerHTML = html.trim();
+            return template.content;
+        });
+    }
+
+    function postJSON(url, body) {
+        return fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(body),
+        }).then(response => {
+            if (!response.ok) {
+                throw new Error(`${url}: ${response.status}`);
+            }
+            return response.json();
+        });
+    }
+
+    function bindColumn(container) {
+        container.querySelectorAll('.issue-card').forEach(makeDraggable);
+
         container.addEventListener('dragover', function(e) {
             e.preventDefault();
             this.style.backgroundColor = '#f0f0f0';
         });
-        
+
         container.addEventListener('dragleave', function() {
             this.style.backgroundColor = '#f3f3f3';
         });
-        
+
         container.addEventListener('drop', function(e) {
             e.preventDefault();
             this.style.backgroundColor = '#f3f3f3';
-            
+
             const issueId = e.dataTransfer.getData('text/plain');
-            const moveForm = document.createElement('form');
-            moveForm.method = 'POST';
-            moveForm.action = `/issue/${issueId}/move`;
-            
-            const columnIdInput = document.createElement('input');
-            columnIdInput.type = 'hidden';
-            columnIdInput.name = 'column_id';
-            columnIdInput.value = columnId;
-            
-            const positionInput = document.createElement('input');
-            positionInput.type = 'hidden';
-            positionInput.name = 'position';
-            positionInput.value = '0';
-            
-            moveForm.appendChild(columnIdInput);
-            moveForm.appendChild(positionInput);
-            document.body.appendChild(moveForm);
-            moveForm.submit();
+            const card = findCard(issueId);
+            if (!card) {
+                return;
+            }
+            const source = card.closest('.column-container');
+            const { after, before } = dropNeighbours(this, e.clientY, issueId);
+            // Move the card right away; the server's answer only re-renders
+            // the columns involved.
+            this.querySelector('.column-cards').insertBefore(card, before);
+
+            const move = { id: Number(issueId), column_id: Number(this.dataset.columnId) };
+            if (after) {
+                move.after_id = Number(after.dataset.issueId);
+            }
+            if (before) {
+                move.before_id = Number(before.dataset.issueId);
+            }
+            const columnIds = new Set([this.dataset.columnId, source.dataset.columnId]);
+            postJSON('/api/v1/issues/move', [move])
+                .then(() => Promise.all(Array.from(columnIds, refreshColumn)))
+                .then(refreshGantt)
+                .catch(fail);
+        });
+
+        // Adding an issue posts it to the API and re-renders only this column.
+        const form = container.querySelector('form.add-issue');
+        if (form && projectId) {
+            form.addEventListener('submit', function(e) {
+                e.preventDefault();
+                const data = new FormData(form);
+                postJSON(`/api/v1/projects/${projectId}/issues`, [{
+                    column_id: Number(data.get('column_id')),
+                    title: data.get('title'),
+                    description: data.get('description') || '',
+                }])
+                    .then(() => refreshColumn(container.dataset.columnId))
+                    .then(refreshGantt)
+                    .catch(fail);
+            });
+        }
+    }
+
+    function refreshColumn(columnId) {
+        return fetchFragment(
+            `/project/${projectId}/fragments/column/${columnId}`
+        ).then(fragment => {
+            const current = findColumn(columnId);
+            const container = fragment.firstElementChild;
+            if (current && container) {
+                current.replaceWith(container);
+                bindColumn(container);
+            }
+        });
+    }
+
+    // Only the board page has a gantt under its columns.
+    function refreshGantt() {
+        const gantt = document.querySelector('.gantt');
+        if (!gantt) {
+            return null;
+        }
+        return fetchFragment(`/project/${projectId}/fragments/gantt`)
+            .then(fragment => gantt.replaceChildren(fragment));
+    }
+
+    document.querySelectorAll('.column-container').forEach(bindColumn);
+
+    // Live updates: other viewers' changes arrive as deltas on the project's
+    // event stream and are applied to the cards in place.
+    if (!projectId || !window.EventSource) {
+        return;
+    }
+
+    function columnCards(columnId) {
+        const container = findColumn(columnId);
+        return container ? container.querySelector('.column-cards') : null;
+    }
+
+    // Cards are ordered by position, like the server renders them.
+    function place(card, columnId, position) {
+        const list = columnCards(columnId);
+        if (!list) {
+            card.remove();
+            return;
+        }
+        card.dataset.position = position;
+        const next = Array.from(list.querySelectorAll('.issue-card')).find(
+            other => other !== card && Number(other.dataset.position) > position);
+        list.insertBefore(card, next || null);
+    }
+
+    function setExcerpt(card, text) {
+        let excerpt = card.querySelector('.card-excerpt');
+        if (!text) {
+            if (excerpt) {
+                excerpt.remove();
+            }
+            return;
+        }
+        if (!excerpt) {
+            excerpt = document.createElement('div');
+            excerpt.className = 'card-excerpt';
+            excerpt.style.cssText = 'font-size: 0.9em; color: #777; margin-top: 5px;';
+            card.appendChild(excerpt);
+        }
+        excerpt.textContent = text + '...';
+    }
+
+    function addCard(message) {
+        return fetchFragment(`/issue/${message.id}/fragments/card`).then(fragment => {
+            const card = fragment.firstElementChild;
+            // Our own add may have re-rendered the column meanwhile.
+            if (!card || findCard(message.id)) {
+                return;
+            }
+            makeDraggable(card);
+            place(card, message.column_id, message.position);
         });
+    }
+
+    const handlers = {
+        issue(message) {
+            const card = findCard(message.id);
+            if (message.action === 'create') {
+                if (!card) {
+                    addCard(message).catch(fail);
+                }
+                return;
+            }
+            if (!card) {
+                return;
+            }
+            if ('title' in message) {
+                card.querySelector('.subject a').textContent = message.title;
+            }
+            if ('description' in message) {
+                setExcerpt(card, message.description);
+            }
+            if ('status' in message) {
+                card.dataset.status = message.status;
+                refreshGantt()?.catch(fail);
+            }
+            if ('column_id' in message) {
+                place(card, message.column_id, message.position);
+            }
+        },
+        column(message) {
+            for (const [issueId, position] of message.positions) {
+                const card = findCard(issueId);
+                if (card) {
+                    card.dataset.position = position;
+                }
+            }
+        },
+    };
+
+    const stream = new EventSource(`/project/${projectId}/stream`);
+    stream.onmessage = function(e) {
+        const message = JSON.parse(e.data);
+        const handler = handlers[message.kind];
+        if (handler) {
+            handler(message);
+        }
+    };
+    // Sent when this page missed deltas it can no longer catch up on.
+    stream.addEventListener('reset', function() {
+        stream.close();
+        window.location.reload();
     });
 });
-